@@ -0,0 +1,376 @@
+"""
+Benchmarks for `datafy.get`, run against a local stand-in HTTP server serving generated payloads.
+
+Each scenario runs in a fresh Python process, so that its peak RSS is its own, and reports its wall-clock time,
+throughput, peak RSS, peak temporary disk usage and per-phase timings. The cost of importing datafy in a fresh process,
+in time and memory, is reported alongside. A scenario which fails is reported with the error output of its worker
+instead, and the rest are run all the same. The results are written out as JSON, for comparison across releases:
+
+    python bench.py --output bench_output.txt
+    python bench.py --csv-size 2048 --members 10000 --scenario csv_stream --scenario zip_members
+
+Payloads are generated once into a scratch directory (`--data`, by default a temporary directory), and reused on later
+runs when the directory is passed again.
+"""
+import argparse
+import csv
+import functools
+import gzip
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+
+# Scenarios: the payload each one reads, and the keyword arguments `get` is called with. Payloads under untyped/ are
+# served without a content-type header, so that they have to be sniffed.
+SCENARIOS = {
+    'csv_memory': ('big.csv', {}),
+    'csv_stream': ('big.csv', {'stream': True}),
+    'csv_ranged': ('big.csv', {'connections': 4}),
+    'csv_untyped': ('untyped/big.csv', {'stream': True}),
+    'zip_members': ('members.zip', {'stream': True}),
+    'zip_members_in_archive': ('members.zip', {'stream': True, 'in_archive': True}),
+    'zip_members_pool': ('members.zip', {'stream': True, 'in_archive': True, 'executor': 'threads'}),
+    'zip_untyped': ('untyped/members.zip', {'stream': True, 'in_archive': True}),
+    'nested_zip': ('nested.zip', {'stream': True}),
+    'nested_tar_gz': ('nested.tar.gz', {'stream': True}),
+}
+
+
+# Payload generation.
+def _csv_rows(rng):
+    while True:
+        yield [rng.randint(0, 10 ** 6), "{0:.6f}".format(rng.random()), rng.choice(['BRONX', 'BROOKLYN', 'QUEENS']),
+               "".join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(12))]
+
+
+def _write_csv(f, size, rng):
+    """Writes a CSV file of (about) `size` bytes to the given text file."""
+    writer = csv.writer(f)
+    writer.writerow(['id', 'value', 'borough', 'name'])
+    rows = _csv_rows(rng)
+    while f.tell() < size:
+        for _ in range(1000):
+            writer.writerow(next(rows))
+
+
+def _small_csv(rng, rows=20):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['id', 'value', 'borough', 'name'])
+    for row, _ in zip(_csv_rows(rng), range(rows)):
+        writer.writerow(row)
+    return buffer.getvalue().encode('utf-8')
+
+
+def _zip_bytes(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as z:
+        for name, content in files.items():
+            z.writestr(name, content)
+    return buffer.getvalue()
+
+
+def generate(directory, csv_size, members):
+    """Generates the benchmark payloads into the given directory, unless they are there already."""
+    manifest_path = os.path.join(directory, 'manifest.json')
+    manifest = {'csv_size': csv_size, 'members': members}
+    try:
+        with open(manifest_path) as f:
+            if json.load(f) == manifest:
+                return
+    except (FileNotFoundError, ValueError):
+        pass
+
+    rng = random.Random(0)
+    os.makedirs(os.path.join(directory, 'untyped'), exist_ok=True)
+
+    with open(os.path.join(directory, 'big.csv'), 'w', newline='') as f:
+        _write_csv(f, csv_size, rng)
+
+    # A ZIP of many small files, like a tiled dataset: a third each of CSV files, shapefile sidecars and text files.
+    with zipfile.ZipFile(os.path.join(directory, 'members.zip'), 'w', zipfile.ZIP_DEFLATED) as z:
+        for i in range(members):
+            kind = i % 3
+            if kind == 0:
+                z.writestr('tiles/{0:05d}.csv'.format(i), _small_csv(rng))
+            elif kind == 1:
+                z.writestr('tiles/{0:05d}.dbf'.format(i), bytes(rng.getrandbits(8) for _ in range(256)))
+            else:
+                z.writestr('tiles/{0:05d}.txt'.format(i), _small_csv(rng, rows=5))
+
+    # Archives inside of archives, three levels deep.
+    leaves = {'{0}.csv'.format(i): _small_csv(rng, rows=2000) for i in range(8)}
+    inner = _zip_bytes(leaves)
+    middle = _zip_bytes({'inner_{0}.zip'.format(i): inner for i in range(4)})
+    with open(os.path.join(directory, 'nested.zip'), 'wb') as f:
+        f.write(_zip_bytes({'middle_{0}.zip'.format(i): middle for i in range(4)}))
+    with tarfile.open(os.path.join(directory, 'nested.tar.gz'), 'w:gz') as tf:
+        for i in range(4):
+            for name, content in (('middle_{0}.zip'.format(i), middle),
+                                  ('rows_{0}.csv.gz'.format(i), gzip.compress(leaves['0.csv']))):
+                info = tarfile.TarInfo('bundle/' + name)
+                info.size = len(content)
+                tf.addfile(info, io.BytesIO(content))
+
+    for name in ('big.csv', 'members.zip'):
+        target = os.path.join(directory, 'untyped', name)
+        if os.path.exists(target):
+            os.remove(target)
+        os.link(os.path.join(directory, name), target)
+
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+
+
+# The stand-in server.
+class _Handler(SimpleHTTPRequestHandler):
+    """Serves the payload directory, with HTTP Range support, and without content-types under untyped/."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def guess_type(self, path):
+        return None if '/untyped/' in path else super().guess_type(path)
+
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'content-type' and value is None:
+            return
+        super().send_header(keyword, value)
+
+    def do_GET(self):
+        ranges = self.headers.get('Range')
+        if not ranges:
+            return super().do_GET()
+
+        path = self.translate_path(self.path)
+        size = os.path.getsize(path)
+        start, end = ranges.split('=')[1].split('-')
+        start, end = int(start), min(int(end) if end else size - 1, size - 1)
+        self.send_response(206)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(start, end, size))
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining:
+                chunk = f.read(min(remaining, 2 ** 16))
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    def end_headers(self):
+        self.send_header('Accept-Ranges', 'bytes')
+        super().end_headers()
+
+
+def serve(directory):
+    """Starts serving the given directory on a free localhost port, returning the server."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(_Handler, directory=directory))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# The worker, which runs a single scenario in its own process.
+def _disk_used(path):
+    stat = os.statvfs(path)
+    return (stat.f_blocks - stat.f_bfree) * stat.f_frsize
+
+
+class _DiskSampler(threading.Thread):
+    """Samples the disk usage of the filesystem holding the temporary directory, keeping the peak above baseline."""
+    def __init__(self, path, interval=0.01):
+        super().__init__(daemon=True)
+        self.path = path
+        self.interval = interval
+        self.baseline = _disk_used(path)
+        self.peak = 0
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.is_set():
+            self.peak = max(self.peak, _disk_used(self.path) - self.baseline)
+            time.sleep(self.interval)
+
+    def stop(self):
+        self.done.set()
+        self.join()
+        self.peak = max(self.peak, _disk_used(self.path) - self.baseline)
+        return self.peak
+
+
+def _consume(data):
+    """Reads the dataset in the "data" field of a document through, returning the number of bytes read."""
+    if hasattr(data, 'iter_content'):
+        return len(data.content)
+    total = 0
+    with data, (data.open() if hasattr(data, 'open') else data) as f:
+        while True:
+            chunk = f.read(2 ** 20)
+            if not chunk:
+                return total
+            total += len(chunk)
+
+
+def run_worker(spec):
+    from concurrent.futures import ThreadPoolExecutor
+    from datafy import datafy, observers
+
+    kwargs = dict(spec['kwargs'])
+    if kwargs.get('executor') == 'threads':
+        kwargs['executor'] = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+    # Per-phase timings are those reported to an observer. Nested phases (detecting the type of a resource while
+    # sniffing it, say) are counted towards their enclosing phase as well.
+    stats = observers.Stats()
+    sampler = _DiskSampler(tempfile.gettempdir())
+    sampler.start()
+    start = time.perf_counter()
+    results = datafy.get(spec['uri'], observer=stats, **kwargs)
+    fetched = time.perf_counter()
+    read = sum(_consume(doc['data']) for doc in results)
+    end = time.perf_counter()
+    peak_temp = sampler.stop()
+    summary = stats.summary()
+
+    return {
+        'documents': len(results),
+        'bytes_read': read,
+        'seconds': end - start,
+        'phases': dict({name: phase['total'] for name, phase in summary['phases'].items()}, read=end - fetched),
+        'details': {name: phase['details'] for name, phase in summary['phases'].items() if phase['details']},
+        'events': summary['events'],
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'peak_temp_bytes': peak_temp,
+        'working_directory_bytes': sum(os.path.getsize(os.path.join(root, name))
+                                       for root, _, names in os.walk('.') for name in names)
+    }
+
+
+# Dependencies which datafy defers until they are first needed, and which importing it therefore shouldn't load.
+DEFERRED = ('requests', 'requests_file', 'urllib3', 'magic', 'asyncio', 'aiohttp')
+
+
+def run_import_worker():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    modules = len(sys.modules)
+    start = time.perf_counter()
+    import datafy  # noqa: F401
+    end = time.perf_counter()
+
+    return {
+        'seconds': end - start,
+        'rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - rss,
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'modules': len(sys.modules) - modules,
+        'deferred_loaded': [name for name in DEFERRED if name in sys.modules]
+    }
+
+
+def measure_import(repeat):
+    """Times `import datafy` in `repeat` fresh interpreters, reporting the fastest."""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--import-worker'],
+                                check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(output))
+
+    best = min(runs, key=lambda run: run['seconds'])
+    return dict(best, runs=[run['seconds'] for run in runs])
+
+
+def run_scenario(name, base_uri, data, repeat):
+    path, kwargs = SCENARIOS[name]
+    spec = {'uri': base_uri + path, 'kwargs': kwargs}
+    size = os.path.getsize(os.path.join(data, path))
+
+    runs = []
+    for _ in range(repeat):
+        # Each run gets a fresh working directory, so that anything written to it shows up.
+        with tempfile.TemporaryDirectory() as cwd:
+            process = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', json.dumps(spec)],
+                                     cwd=cwd, capture_output=True, text=True)
+        # A scenario which fails is reported as such, rather than taking the rest of the report down with it.
+        if process.returncode != 0:
+            return {'scenario': name, 'uri': spec['uri'], 'kwargs': kwargs, 'payload_bytes': size,
+                    'error': "The worker exited with status {0}.".format(process.returncode),
+                    'stderr': process.stderr}
+        runs.append(json.loads(process.stdout))
+
+    best = min(runs, key=lambda run: run['seconds'])
+    return dict(best, scenario=name, uri=spec['uri'], kwargs=kwargs, payload_bytes=size,
+                throughput_mb_s=size / best['seconds'] / 2 ** 20, runs=[run['seconds'] for run in runs])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help="Scenario to run; may be given more than once. Runs all of them by default.")
+    parser.add_argument('--csv-size', type=int, default=64, help="Size of the big CSV payload, in MiB.")
+    parser.add_argument('--members', type=int, default=10000, help="Number of files in the many-member ZIP payload.")
+    parser.add_argument('--repeat', type=int, default=3, help="Number of runs per scenario; the fastest is reported.")
+    parser.add_argument('--data', help="Directory to generate the payloads into and reuse them from.")
+    parser.add_argument('--output', help="File to write the JSON report to, instead of standard output.")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--import-worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.import_worker:
+        json.dump(run_import_worker(), sys.stdout)
+        return
+    if args.worker:
+        json.dump(run_worker(json.loads(args.worker)), sys.stdout)
+        return
+
+    import_cost = measure_import(max(args.repeat, 5))
+
+    data = args.data or tempfile.mkdtemp(prefix='datafy-bench-')
+    try:
+        generate(data, args.csv_size * 2 ** 20, args.members)
+        server = serve(data)
+        base_uri = 'http://127.0.0.1:{0}/'.format(server.server_address[1])
+        try:
+            results = [run_scenario(name, base_uri, data, args.repeat) for name in args.scenario or SCENARIOS]
+        finally:
+            server.shutdown()
+    finally:
+        if not args.data:
+            shutil.rmtree(data)
+
+    revision = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=HERE, capture_output=True, text=True).stdout.strip()
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'revision': revision,
+        'csv_size': args.csv_size * 2 ** 20,
+        'members': args.members,
+        'import': import_cost,
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,15 @@
-from .datafy import get, FileTooLargeException
\ No newline at end of file
+from .datafy import (get, get_many, sniff, ArchiveMember, LazyResource, MappedFile, Record, FileTooLargeException,
+                     default_resolver, configure)
+from .transport import TransportPolicy
+from .resolver import TypeResolver
+from .cache import Cache
+from .observers import Observer, NullObserver, Stats, observe, current_observer
+from .archives import ArchiveReader, register_reader
+
+
+def __getattr__(name):
+    # The asyncio interface is only imported when it is first used, since asyncio is slow to import.
+    if name in ('aget', 'aget_many'):
+        from . import aio
+        return getattr(aio, name)
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
@@ -0,0 +1,168 @@
+"""
+asyncio variants of `get` and `get_many`, for use inside of asynchronous crawlers. Network I/O is done using `aiohttp`,
+which is an optional dependency (`pip install datafy[async]`); type detection and archive expansion, which block, are
+run on the event loop's default executor.
+"""
+import asyncio
+import contextvars
+import functools
+import tempfile
+from urllib.parse import urlsplit
+
+from .datafy import (get, FileTooLargeException, CHUNK_SIZE, SNIFF_SIZE, MAX_DEPTH, _guess_type, _read_head,
+                     _find_reader, _read_archive)
+from .observers import current_observer, observe
+from . import datafy as _datafy
+
+
+def _aiohttp():
+    try:
+        import aiohttp
+    except ImportError:
+        raise ImportError("The asynchronous API requires the aiohttp library. Install it with `pip install aiohttp`.")
+    return aiohttp
+
+
+def _finish(uri, content_type, spool, sizeout, type_hints, in_archive, sniff_size, max_depth, executor):
+    """
+    The blocking second half of `aget`: classifies the spooled body and expands it if it is an archive. Mirrors the
+    tail end of `get` with `stream=True`.
+    """
+    if type_hints != (None, None):
+        mime, ext = type_hints
+    else:
+        mime, ext = _guess_type(content_type, lambda: _read_head(spool, sniff_size), uri)
+
+    reader = _find_reader(uri, mime, ext)
+    if reader is not None:
+        return _read_archive(uri, reader, spool, sizeout=sizeout, in_archive=in_archive, sniff_size=sniff_size,
+                             max_depth=max_depth, executor=executor)
+    else:
+        return [{'data': spool, 'filepath': '.', 'mimetype': mime, 'extension': ext}]
+
+
+async def aget(uri, sizeout=None, type_hints=(None, None), in_archive=False, sniff_size=SNIFF_SIZE, session=None,
+               max_depth=MAX_DEPTH, executor=None, observer=None):
+    """
+    Asynchronous version of `get`, with the same semantics as `get` with `stream=True`: the body is spooled to an
+    anonymous temporary file as it downloads, and a binary file object positioned at the start of it is returned in
+    the "data" field of the result.
+
+    Parameters
+    ----------
+    uri: str (required)
+        The URI corresponding with the result download link.
+    sizeout: int
+        See `get`.
+    type_hints: (str, str) tuple
+        See `get`.
+    in_archive: bool
+        See `get`.
+    sniff_size: int
+        See `get`.
+    session: aiohttp.ClientSession
+        The session to make requests with. If this is not provided a session will be created for this call alone;
+        pass one in when making many calls, so that they can share connections.
+    max_depth: int
+        See `get`.
+    executor: concurrent.futures.Executor
+        See `get`.
+    observer: datafy.Observer
+        See `get`.
+
+    Returns
+    -------
+    The same list of documents that `get` returns. May raise a FileSizeTooLarge along the way.
+    """
+    if observer is not None:
+        with observe(observer):
+            return await aget(uri, sizeout=sizeout, type_hints=type_hints, in_archive=in_archive,
+                              sniff_size=sniff_size, session=session, max_depth=max_depth, executor=executor)
+
+    # The blocking work is done on the default executor, in a copy of this task's context, so that it sees the same
+    # observer.
+    loop = asyncio.get_running_loop()
+    observer = current_observer()
+
+    # aiohttp doesn't speak file://, and there is no network I/O to be had for local files anyway.
+    if uri.startswith("file://"):
+        return await loop.run_in_executor(None, functools.partial(
+            contextvars.copy_context().run, get, uri, sizeout=sizeout, type_hints=type_hints, stream=True,
+            in_archive=in_archive, sniff_size=sniff_size, max_depth=max_depth, executor=executor
+        ))
+
+    aiohttp = _aiohttp()
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await aget(uri, sizeout=sizeout, type_hints=type_hints, in_archive=in_archive,
+                              sniff_size=sniff_size, session=session, max_depth=max_depth,
+                              executor=executor)
+
+    # Requests follow the timeouts of the transport policy installed with `configure`.
+    policy = _datafy.transport_policy
+    timeout = aiohttp.ClientTimeout(sock_connect=policy.connect_timeout, sock_read=policy.read_timeout)
+
+    # First send a HEAD request and back out if sizeout is exceeded.
+    if sizeout:
+        with observer.phase('head', uri):
+            # Unlike requests, aiohttp doesn't follow redirects on HEAD requests unless told to, and the headers of a
+            # redirect say nothing about the size of the resource behind it.
+            async with session.head(uri, timeout=timeout, allow_redirects=True) as r:
+                content_length = r.headers.get('content-length')
+        if content_length is not None and int(content_length) > sizeout:
+            raise FileTooLargeException
+
+    # Then send a GET request, spooling the body to disk as it comes in and cutting it off if it goes over budget.
+    spool = tempfile.TemporaryFile()
+    try:
+        with observer.phase('transfer', uri) as span:
+            async with session.get(uri, timeout=timeout) as r:
+                # Error pages are raised as `aiohttp.ClientResponseError`, rather than spooled as the resource.
+                r.raise_for_status()
+                content_type = r.headers.get('content-type')
+                received = 0
+                async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+                    received += len(chunk)
+                    if sizeout is not None and received > sizeout:
+                        raise FileTooLargeException("The resource at {0} exceeds the sizeout of {1} bytes.".format(
+                            uri, sizeout
+                        ))
+                    spool.write(chunk)
+            span.details['bytes'] = received
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+
+    return await loop.run_in_executor(None, contextvars.copy_context().run, _finish, uri, content_type, spool, sizeout,
+                                      type_hints, in_archive, sniff_size, max_depth, executor)
+
+
+async def aget_many(uris, max_workers=8, max_per_host=4, sizeout=None, **kwargs):
+    """
+    Asynchronous version of `get_many`. Runs `aget` over a list of URIs concurrently on a single shared
+    `aiohttp.ClientSession`, with at most `max_workers` requests in flight at once and at most `max_per_host` of those
+    going to any one host.
+
+    Returns
+    -------
+    A list with one entry per URI, in the same order as `uris`. Each entry is either the list of documents that `aget`
+    returned for that URI, or the exception that `aget` raised for it.
+    """
+    aiohttp = _aiohttp()
+    limit = asyncio.Semaphore(max_workers)
+    host_limits = {}
+
+    async def fetch(uri, session):
+        host_limit = host_limits.setdefault(urlsplit(uri).netloc, asyncio.Semaphore(max_per_host))
+        # The host slot is waited for first, so that a URI for a busy host doesn't hold onto one of the `max_workers`
+        # slots, and so hold up the URIs for every other host, while it waits.
+        async with host_limit, limit:
+            try:
+                return await aget(uri, sizeout=sizeout, session=session, **kwargs)
+            except Exception as e:
+                return e
+
+    connector = aiohttp.TCPConnector(limit=max_workers, limit_per_host=max_per_host)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await asyncio.gather(*[fetch(uri, session) for uri in uris])
@@ -0,0 +1,187 @@
+"""
+Readers for the archive formats that `get` looks inside of. Each reader knows how to list the files inside of one kind
+of archive, reading it as a stream wherever the format allows, so that nested archives can be read without first being
+written out to disk. Support for further formats can be added by subclassing `ArchiveReader` and passing an instance
+to `register_reader`.
+"""
+import bz2
+import functools
+import gzip
+import lzma
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+
+# Archives nested inside of other archives which aren't seekable (members of a streamed TAR file, for example) have to
+# be buffered before they can be read as ZIP files, since the ZIP central directory sits at the end of the file. Up to
+# this many bytes are buffered in memory, past which the buffer rolls over to an anonymous temporary file.
+SPOOL_SIZE = 2 ** 24
+
+
+class ArchiveReader:
+    """
+    Base class for archive readers. Subclasses list the file extensions and mimetypes they handle, and implement
+    `members`.
+    """
+    extensions = ()
+    mimetypes = ()
+
+    def matches(self, name, extension, mimetype):
+        """
+        Whether or not this reader handles the file with the given name, extension and mimetype. The extension is
+        trusted over the mimetype, since e.g. XLSX and DOCX files are ZIP files as far as `magic` is concerned.
+        """
+        if extension:
+            return extension.lower() in self.extensions
+        return mimetype in self.mimetypes
+
+    def members(self, f, reopen, persistent):
+        """
+        Yields a (name, size, fileobj, reopen_member) tuple for every file inside of the archive read by the binary
+        file object `f`. `size` is the decompressed size of the member, or None if that isn't known up front.
+        `fileobj` is a binary file object reading the member, which is only valid until the next member is yielded.
+        `reopen_member` is a callable which returns a new binary file object reading the member, for use later on.
+
+        If `persistent` is set, `f` is seekable and will stay open for as long as the members are in use, so that
+        `reopen_member` may read from it directly. Otherwise `reopen` is a callable returning a new binary file object
+        reading the archive, which `reopen_member` should use instead.
+        """
+        raise NotImplementedError
+
+
+class ZipReader(ArchiveReader):
+    extensions = ('zip', 'kmz')
+    mimetypes = ('application/zip', 'application/vnd.google-earth.kmz')
+
+    def members(self, f, reopen, persistent):
+        if not f.seekable():
+            f = _buffer(f)
+        z = zipfile.ZipFile(f)
+        for info in z.infolist():
+            if info.is_dir():
+                continue
+            if persistent:
+                reopen_member = functools.partial(z.open, info)
+            else:
+                reopen_member = functools.partial(_reopen_zip_member, reopen, info.filename)
+            with z.open(info) as member:
+                yield info.filename, info.file_size, member, reopen_member
+
+
+class TarReader(ArchiveReader):
+    extensions = ('tar', 'tgz', 'tbz', 'tbz2', 'txz')
+    mimetypes = ('application/x-tar', 'application/x-gtar')
+    suffixes = ('.tar', '.tar.gz', '.tar.bz2', '.tar.xz')
+
+    def matches(self, name, extension, mimetype):
+        return name.lower().endswith(self.suffixes) or super().matches(name, extension, mimetype)
+
+    def members(self, f, reopen, persistent):
+        # Seekable archives are opened in random access mode, so that members can be read again later without
+        # rereading the archive from the start. Anything else is read as a stream, in one pass.
+        # The TarFile is left open in the former case, since the members are read through it.
+        tf = tarfile.open(fileobj=f, mode='r:*' if persistent else 'r|*')
+        try:
+            for info in tf:
+                if not info.isfile():
+                    continue
+                if persistent:
+                    reopen_member = functools.partial(tf.extractfile, info)
+                else:
+                    reopen_member = functools.partial(_reopen_tar_member, reopen, info.name)
+                yield info.name, info.size, tf.extractfile(info), reopen_member
+        finally:
+            if not persistent:
+                tf.close()
+
+
+class _CompressedFileReader(ArchiveReader):
+    """
+    Base class for readers of compressed files, which hold just the one member: the file that was compressed. It is
+    named after the compressed file, less the compression suffix.
+    """
+    def open(self, f):
+        raise NotImplementedError
+
+    def members(self, f, reopen, persistent):
+        def reopen_member():
+            return self.open(reopen())
+
+        yield '', None, self.open(f), reopen_member
+
+
+class GzipReader(_CompressedFileReader):
+    extensions = ('gz',)
+    mimetypes = ('application/gzip', 'application/x-gzip')
+
+    def open(self, f):
+        return gzip.GzipFile(fileobj=f, mode='rb')
+
+
+class Bz2Reader(_CompressedFileReader):
+    extensions = ('bz2',)
+    mimetypes = ('application/x-bzip2',)
+
+    def open(self, f):
+        return bz2.BZ2File(f, mode='rb')
+
+
+class XzReader(_CompressedFileReader):
+    extensions = ('xz',)
+    mimetypes = ('application/x-xz',)
+
+    def open(self, f):
+        return lzma.LZMAFile(f, mode='rb')
+
+
+# The readers `get` consults, in order. TAR comes before the compressed file readers, so that compressed TAR files are
+# read in a single pass.
+readers = [TarReader(), ZipReader(), GzipReader(), Bz2Reader(), XzReader()]
+
+
+def register_reader(reader):
+    """Registers the given `ArchiveReader`, giving it precedence over the readers already registered."""
+    readers.insert(0, reader)
+
+
+def find_reader(name, extension, mimetype):
+    """Returns the reader which handles the file with the given name, extension and mimetype, or None."""
+    for reader in readers:
+        if reader.matches(name, extension, mimetype):
+            return reader
+    return None
+
+
+def member_path(archive_path, reader, name):
+    """
+    The path to report for the member with the given name inside of the archive at the given path. Members of nested
+    archives get paths of the form "outer.zip/inner.zip/member.csv". The single member of a compressed file takes the
+    place of the compressed file, so "data.csv.gz" holds "data.csv".
+    """
+    if isinstance(reader, _CompressedFileReader):
+        stem, extension = posixpath.splitext(archive_path)
+        return stem if extension.lower()[1:] in reader.extensions else archive_path
+    return posixpath.join(archive_path, name) if archive_path else name
+
+
+def _buffer(f):
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    shutil.copyfileobj(f, buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def _reopen_zip_member(reopen, name):
+    f = reopen()
+    return zipfile.ZipFile(f if f.seekable() else _buffer(f)).open(name)
+
+
+def _reopen_tar_member(reopen, name):
+    tf = tarfile.open(fileobj=reopen(), mode='r|*')
+    for info in tf:
+        if info.name == name:
+            return tf.extractfile(info)
+    raise KeyError("There is no member named {0!r} in the archive.".format(name))
@@ -0,0 +1,218 @@
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class Cache:
+    """
+    A persistent, size-bounded on-disk cache of downloaded resources, for use with `get(..., cache=Cache(...))`.
+
+    Bodies are stored content-addressed, under the SHA-256 digest of their contents, so that resources which are served
+    from several URIs are only stored once. Alongside each URI the cache keeps the ETag and Last-Modified validators the
+    server sent, which `get` uses to revalidate the entry with a conditional request, and the listing of datasets (file
+    paths, mimetypes and extensions) that was worked out for the resource, so that an unchanged resource doesn't need to
+    be classified again. When the cache grows past `max_bytes` the least recently used entries are evicted.
+
+    The index of entries is kept as a snapshot (index.json) and a journal of the changes made since (journal.jsonl),
+    which is replayed on top of the snapshot when the cache is opened. Lookups and stores only append a line to the
+    journal, rather than rewriting the whole index, so that keeping a cache of many entries up to date costs the same
+    per resource however large it grows. The journal is folded into a new snapshot once it outgrows the index.
+
+    Parameters
+    ----------
+    directory: str
+        The directory to keep the cache in. It is created if it doesn't exist already.
+    max_bytes: int
+        The maximum total size of the bodies kept in the cache, in bytes.
+    """
+    def __init__(self, directory, max_bytes=2 ** 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._objects = os.path.join(directory, 'objects')
+        self._index_path = os.path.join(directory, 'index.json')
+        self._journal_path = os.path.join(directory, 'journal.jsonl')
+        self._lock = threading.Lock()
+        os.makedirs(self._objects, exist_ok=True)
+
+        try:
+            with open(self._index_path) as f:
+                self._index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._index = {}
+        self._journal_length = 0
+        try:
+            with open(self._journal_path) as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except ValueError:
+                        # A line left half-written by a process which died while appending it.
+                        continue
+                    self._journal_length += 1
+        except FileNotFoundError:
+            pass
+
+        # The number of entries referring to each body, and the total size of the bodies, kept up to date as entries
+        # come and go so that storing an entry doesn't mean going over the whole index.
+        self._references = collections.Counter(entry['digest'] for entry in self._index.values())
+        self._sizes = {entry['digest']: entry['size'] for entry in self._index.values()}
+        self._total = sum(self._sizes.values())
+
+    def path(self, entry):
+        """The path to the cached body of the given entry."""
+        return os.path.join(self._objects, entry['digest'])
+
+    def lookup(self, uri):
+        """Returns the entry for the given URI, or None if there isn't one, and marks it as recently used."""
+        with self._lock:
+            entry = self._index.get(uri)
+            if entry is None:
+                return None
+            if not os.path.exists(self.path(entry)):
+                self._release(self._index.pop(uri))
+                self._log({'uri': uri, 'entry': None})
+                return None
+            entry['accessed'] = time.time()
+            self._log({'uri': uri, 'accessed': entry['accessed']})
+            return dict(entry)
+
+    @staticmethod
+    def validators(entry):
+        """The conditional request headers with which to revalidate the given entry."""
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def ingest(self, chunks):
+        """
+        Writes the body made up of the given iterable of byte chunks into the cache, returning its (digest, size). The
+        body is not associated with any URI until `store` is called, but it is counted as referred to until `release`
+        is called on it, so that it isn't deleted from under its reader in the meantime; callers should `store` it
+        first and `release` it after, or merely `release` it to discard it.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self._objects, prefix='.incoming-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            os.replace(temp_path, os.path.join(self._objects, digest.hexdigest()))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        with self._lock:
+            self._add({'digest': digest.hexdigest(), 'size': size})
+        return digest.hexdigest(), size
+
+    def release(self, digest):
+        """
+        Drops the reference held on the ingested body with the given digest, deleting it if no stored entry refers to
+        it.
+        """
+        with self._lock:
+            self._release({'digest': digest})
+
+    def store(self, uri, digest, size, headers, listing, archive=None):
+        """
+        Associates the ingested body with the given digest and size with the given URI, along with the validators in
+        the given response headers and the given listing of the (filepath, mimetype, extension) of the datasets in it,
+        then evicts old entries as needed. If the body is an archive, `archive` is its (mimetype, extension). Returns
+        the new entry.
+        """
+        entry = {
+            'digest': digest,
+            'size': size,
+            'archive': list(archive) if archive else None,
+            'etag': headers.get('etag'),
+            'last_modified': headers.get('last-modified'),
+            'listing': [list(item) for item in listing],
+            'accessed': time.time()
+        }
+        with self._lock:
+            # The new entry is counted before the old one is released, so that a body they share isn't deleted.
+            previous = self._index.get(uri)
+            self._index[uri] = entry
+            self._add(entry)
+            if previous is not None:
+                self._release(previous)
+            self._log({'uri': uri, 'entry': entry})
+            self._evict(keep=uri)
+        return dict(entry)
+
+    def size(self):
+        """The total size of the bodies currently kept in the cache, in bytes."""
+        with self._lock:
+            return self._total
+
+    def flush(self):
+        """Folds the journal into a new snapshot of the index. This happens by itself as the journal grows."""
+        with self._lock:
+            self._save()
+
+    def _add(self, entry):
+        digest = entry['digest']
+        if not self._references[digest]:
+            self._sizes[digest] = entry['size']
+            self._total += entry['size']
+        self._references[digest] += 1
+
+    def _release(self, entry):
+        """Stops counting the given entry, deleting its body if no other entry refers to it any longer."""
+        digest = entry['digest']
+        self._references[digest] -= 1
+        if self._references[digest] <= 0:
+            del self._references[digest]
+            self._total -= self._sizes.pop(digest)
+            try:
+                os.remove(os.path.join(self._objects, digest))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self, keep):
+        if self._total <= self.max_bytes:
+            return
+        for uri in sorted(self._index, key=lambda u: self._index[u]['accessed']):
+            if self._total <= self.max_bytes:
+                break
+            if uri == keep:
+                continue
+            self._release(self._index.pop(uri))
+            self._log({'uri': uri, 'entry': None})
+
+    def _apply(self, record):
+        """Replays a journal record onto the index."""
+        uri = record['uri']
+        if 'accessed' in record:
+            if uri in self._index:
+                self._index[uri]['accessed'] = record['accessed']
+        elif record['entry'] is None:
+            self._index.pop(uri, None)
+        else:
+            self._index[uri] = record['entry']
+
+    def _log(self, record):
+        with open(self._journal_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        self._journal_length += 1
+        if self._journal_length > max(1024, len(self._index)):
+            self._save()
+
+    def _save(self):
+        # The snapshot replaces the old one before the journal is emptied, so that if the process dies in between, the
+        # journal is merely replayed onto a snapshot that already reflects it.
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.index-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(temp_path, self._index_path)
+        open(self._journal_path, 'w').close()
+        self._journal_length = 0
@@ -1,12 +1,27 @@
-import requests
-import mimetypes
 import io
-import zipfile
 import os
-import random
-import shutil
-from requests_file import FileAdapter
-import magic
+import posixpath
+import re
+import tempfile
+import threading
+import collections
+import contextlib
+import contextvars
+import mmap
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+# This is what `urllib.request.url2pathname` is, without importing urllib.request, which drags in ssl and http.client.
+if os.name == 'nt':
+    from nturl2path import url2pathname
+else:
+    from urllib.parse import unquote as url2pathname
+
+from . import archives
+from .resolver import TypeResolver
+from .observers import current_observer, observe
+from .transport import TransportPolicy
 
 
 mime_map = {
@@ -24,16 +39,1120 @@ mime_map = {
 }
 
 
-# Set up requests so that it can be used inline with local files.
-requests_session = requests.Session()
-requests_session.mount("file://", FileAdapter())
+# Extensions which settle the mimetype of a file on their own, without it being handed to `magic`. These are mostly the
+# sidecar files of multi-file formats such as shapefiles, which archives often hold a great many of.
+extension_map = {
+    'shp': 'application/octet-stream',
+    'shx': 'application/octet-stream',
+    'sbn': 'application/octet-stream',
+    'sbx': 'application/octet-stream',
+    'dbf': 'application/x-dbf',
+    'prj': 'text/plain',
+    'cpg': 'text/plain'
+}
+
+
+# The type resolver used by `get`, built on the two tables above; registering rules with it (or editing the tables)
+# changes what `get` reports. The compressed file formats `get` reads into are recognized by their magic numbers, so
+# that spotting them doesn't need `magic`. libmagic only recognizes JSON documents that it sees in their entirety,
+# reporting anything less as text/plain, so JSON is recognized from the start of the document instead.
+def _json_rule(head):
+    """Recognizes the start of a JSON document holding an object or an array of values."""
+    text = head.lstrip(b'\xef\xbb\xbf \t\r\n')
+    if text[:1] == b'{':
+        opens = (b'"', b'}')
+    elif text[:1] == b'[':
+        opens = (b'{', b'[', b'"', b']')
+    else:
+        return None
+    return ('application/json', 'json') if text[1:].lstrip(b' \t\r\n')[:1] in opens else None
+
+
+default_resolver = TypeResolver(mime_map, extension_map)
+default_resolver.register_signature(b'\x1f\x8b', 'application/gzip', 'gz')
+default_resolver.register_signature(b'\xfd7zXZ\x00', 'application/x-xz', 'xz')
+default_resolver.register_rule(_json_rule)
+
+
+# Size of the chunks in which streamed response bodies are read off of the wire and written to the spool file.
+CHUNK_SIZE = 2 ** 16
+
+# Default number of leading bytes of a resource which are handed to the `magic` oracle for type detection. libmagic
+# recognizes the formats `get` cares about from their first few kilobytes, and this many bytes are read off of every
+# resource, and of every archive member, whose type isn't evident from its content-type header or extension, so it is
+# kept small. It is also the size of the Range request `sniff` sends.
+SNIFF_SIZE = 2 ** 12
+
+# Number of times the transfer of a byte range is resumed after its connection drops before `get` gives up on it.
+RANGE_RETRIES = 3
+
+# Maximum number of archive members whose leading bytes are held onto while they wait to be classified on a pool.
+CLASSIFY_BACKLOG = 64
+
+# Default number of levels of archives nested inside of archives that `get` reads into. Archives nested any deeper are
+# returned as they are, like any other file.
+MAX_DEPTH = 4
+
+
+# The transport policy (timeouts, retries, rate limits and resumption) of `requests_session`. Use `configure` to change
+# it.
+transport_policy = TransportPolicy()
+
+# Sizes of the connection pools of the HTTP adapters mounted on `requests_session`: the number of hosts for which
+# connections are kept alive, and the number of connections kept alive per host. `get_many` grows these as needed to
+# fit the concurrency it is asked for, since connections which don't fit in the pool are thrown away after use. The
+# defaults are those of requests (`requests.adapters.DEFAULT_POOLSIZE`).
+_pool_sizes = (10, 10)
+_pool_lock = threading.Lock()
+
+# The requests session everything is downloaded through, which is built the first time it is needed rather than when
+# datafy is imported: requests and requests_file are slow to import, and short-lived processes which only ever read
+# local paths never need them. It is exposed as the module attribute `requests_session` regardless.
+_requests_session = None
+_session_lock = threading.Lock()
+
+
+def _session():
+    """Returns the requests session, building it (and importing requests) if this is the first time it is needed."""
+    global _requests_session
+    if _requests_session is None:
+        with _session_lock:
+            if _requests_session is None:
+                import requests
+                from requests_file import FileAdapter
+
+                # Set up requests so that it can be used inline with local files.
+                session = requests.Session()
+                session.mount("file://", FileAdapter())
+                with _pool_lock:
+                    _mount(*_pool_sizes, session=session)
+                _requests_session = session
+    return _requests_session
+
+
+def __getattr__(name):
+    if name == 'requests_session':
+        return _session()
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+
+
+def _mount(hosts, per_host, session=None):
+    session = _requests_session if session is None else session
+    if session is None:
+        # The session hasn't been built yet, and will pick up the current pool sizes and policy when it is.
+        return
+
+    from .transport import PolicyAdapter
+    for prefix in ("http://", "https://"):
+        session.mount(prefix, PolicyAdapter(transport_policy, pool_connections=hosts, pool_maxsize=per_host))
+
+
+def _resize_pool(hosts, per_host):
+    """Remounts the HTTP(S) adapters of `requests_session` so that their pools fit `hosts` hosts at `per_host` each."""
+    global _pool_sizes
+    with _pool_lock:
+        hosts, per_host = max(hosts, _pool_sizes[0]), max(per_host, _pool_sizes[1])
+        if (hosts, per_host) != _pool_sizes:
+            _mount(hosts, per_host)
+            _pool_sizes = (hosts, per_host)
+
+
+def configure(policy):
+    """
+    Installs the given `TransportPolicy` on `requests_session`, so that every request `get` sends from then on follows
+    it: its connect and read timeouts, its retries with jittered exponential backoff, its per-host rate limit, and the
+    number of times it resumes a body whose connection drops.
+    """
+    global transport_policy
+    with _pool_lock:
+        transport_policy = policy
+        _mount(*_pool_sizes)
 
 
 class FileTooLargeException(TypeError):
     """Raise when the file is larger than the specified sizeout."""
 
 
-def get(uri, sizeout=None, type_hints=(None, None), localized=False):
+def _resume(r, position):
+    """
+    Requests the rest of the body of the given (`stream=True`) response from the given byte offset onwards, returning
+    the new response, or None if the body can't be resumed. Bodies are only resumed if the server answers the Range
+    request with exactly the part asked for, and (where the original response carried a validator) only if the
+    resource hasn't changed in the meantime. Compressed transfers can't be resumed, since the offset is in the
+    decompressed body.
+    """
+    if r.request is None or r.request.method != 'GET' or r.status_code != 200 or \
+            r.headers.get('content-encoding', 'identity') != 'identity' or \
+            r.headers.get('accept-ranges', '').lower() == 'none':
+        return None
+
+    headers = {'Range': 'bytes={0}-'.format(position)}
+    validator = r.headers.get('etag') or r.headers.get('last-modified')
+    if validator:
+        headers['If-Range'] = validator
+    import requests
+    try:
+        resumed = _session().get(r.url, headers=headers, stream=True)
+    except requests.exceptions.RequestException:
+        return None
+    if resumed.status_code != 206 or \
+            not resumed.headers.get('content-range', '').startswith('bytes {0}-'.format(position)):
+        resumed.close()
+        return None
+    return resumed
+
+
+def _raise_for_status(r):
+    """
+    Raises a `requests.HTTPError` if the given response is an error, closing it first, so that error pages are never
+    spooled and handed back as though they were the resource.
+    """
+    if not r.ok:
+        r.close()
+        r.raise_for_status()
+
+
+def _iter_body(r, sizeout=None, chunk_size=CHUNK_SIZE):
+    """
+    Iterates over the body of the given (`stream=True`) response in chunks, counting bytes as they come in. If more
+    than `sizeout` bytes arrive the connection is closed and a FileTooLargeException is raised, so that we never pay
+    for more of the transfer than we are willing to accept. If the connection drops partway through, the body is
+    resumed from where it left off, as many times as `transport_policy` allows.
+    """
+    import requests
+    received = 0
+    resumes = transport_policy.resumes
+    try:
+        while True:
+            try:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    received += len(chunk)
+                    if sizeout is not None and received > sizeout:
+                        raise FileTooLargeException("The resource at {0} exceeds the sizeout of {1} bytes.".format(
+                            r.url, sizeout
+                        ))
+                    yield chunk
+                return
+            except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError):
+                resumed = _resume(r, received) if resumes > 0 else None
+                if resumed is None:
+                    raise
+                r.close()
+                r = resumed
+                resumes -= 1
+                current_observer().event('resume', r.url, position=received)
+    finally:
+        r.close()
+
+
+def _spool(r, sizeout=None, chunk_size=CHUNK_SIZE):
+    """
+    Streams the body of the given (`stream=True`) response into an anonymous temporary file, one chunk at a time, and
+    returns that file rewound to its start. This keeps peak memory usage flat regardless of the size of the resource.
+    """
+    spool = tempfile.TemporaryFile()
+    try:
+        for chunk in _iter_body(r, sizeout=sizeout, chunk_size=chunk_size):
+            spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def _load(r, sizeout=None, chunk_size=CHUNK_SIZE):
+    """
+    Reads the body of the given (`stream=True`) response into memory, subject to `sizeout`, and stores it on the
+    response, so that it is afterwards indistinguishable from one that was fetched with `stream=False`.
+    """
+    r._content = b"".join(_iter_body(r, sizeout=sizeout, chunk_size=chunk_size))
+    r._content_consumed = True
+    return r
+
+
+class _RangesUnsupported(Exception):
+    """
+    Raised when a server turns out not to honor Range requests after all, or the resource changes partway through a
+    ranged download.
+    """
+
+
+def _content_range_matches(headers, position, length):
+    """
+    Whether or not the Content-Range header of a 206 response says that it holds the part of the body starting at
+    `position`, of a resource which is `length` bytes long.
+    """
+    match = re.match(r'bytes\s+(\d+)-(\d+)/(\d+)$', headers.get('content-range', '').strip())
+    return match is not None and int(match.group(1)) == position and int(match.group(3)) == length
+
+
+def _fetch_range(uri, fd, start, end, length, validator=None, retries=RANGE_RETRIES, observer=None):
+    """
+    Downloads the (inclusive) byte range from `start` to `end` of the resource at the given URI, which is `length`
+    bytes long, writing it into the file with the given descriptor at the same offsets. If the connection drops partway
+    through, only the part of the range which hasn't arrived yet is requested again, up to `retries` times, reporting
+    each retry to `observer`.
+
+    Every request is sent with the given validator (the ETag or Last-Modified date of the resource) in an If-Range
+    header, so that if the resource changes partway through the download the server sends the whole of the new version
+    instead of a part of it. That, or any other response which isn't exactly the part of the resource asked for,
+    raises `_RangesUnsupported`, so that the parts of two versions of the resource are never mixed together.
+    """
+    import requests
+    position = start
+    while True:
+        headers = {'Range': 'bytes={0}-{1}'.format(position, end)}
+        if validator:
+            headers['If-Range'] = validator
+        try:
+            r = _session().get(uri, headers=headers, stream=True)
+            if r.status_code != 206 or not _content_range_matches(r.headers, position, length):
+                r.close()
+                raise _RangesUnsupported(uri)
+            try:
+                for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                    chunk = chunk[:end + 1 - position]
+                    os.pwrite(fd, chunk, position)
+                    position += len(chunk)
+                    if position > end:
+                        break
+            finally:
+                r.close()
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            pass
+
+        if position > end:
+            return
+        if retries <= 0:
+            raise requests.exceptions.ChunkedEncodingError(
+                "Received {0} of the {1} bytes requested from {2}.".format(position - start, end - start + 1, uri)
+            )
+        retries -= 1
+        if observer is not None:
+            observer.event('retry', uri, start=start, position=position)
+
+
+def _spool_ranges(uri, connections, sizeout=None):
+    """
+    Downloads the resource at the given URI using `connections` concurrent Range requests, each writing its part of
+    the body into a preallocated anonymous temporary file. Returns the response headers of the resource and that file,
+    rewound to its start, or None if the server doesn't support Range requests, or the resource changed partway
+    through the download.
+    """
+    # The byte ranges are fetched on threads of their own, which don't see the observer installed in this one.
+    observer = current_observer()
+    with observer.phase('head', uri):
+        head = _session().head(uri, allow_redirects=True)
+    if head.headers.get('accept-ranges', '').lower() != 'bytes' or 'content-length' not in head.headers:
+        return None
+    length = int(head.headers['content-length'])
+    if sizeout and length > sizeout:
+        raise FileTooLargeException("The resource at {0} exceeds the sizeout of {1} bytes.".format(uri, sizeout))
+    if length == 0:
+        return None
+
+    # If-Range only accepts strong ETags, so a weak one is passed over in favor of the Last-Modified date.
+    etag = head.headers.get('etag')
+    validator = etag if etag and not etag.startswith('W/') else head.headers.get('last-modified')
+
+    spool = tempfile.TemporaryFile()
+    try:
+        os.ftruncate(spool.fileno(), length)
+        step = -(-length // connections)
+        bounds = [(start, min(start + step, length) - 1) for start in range(0, length, step)]
+        with ThreadPoolExecutor(max_workers=len(bounds)) as executor:
+            futures = [executor.submit(_fetch_range, uri, spool.fileno(), start, end, length, validator=validator,
+                                       observer=observer)
+                       for start, end in bounds]
+            for future in futures:
+                future.result()
+    except _RangesUnsupported:
+        spool.close()
+        return None
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return head.headers, spool
+
+
+def _read_head(body, size=SNIFF_SIZE):
+    """Reads the first `size` bytes of the given seekable binary file, leaving it rewound to its start."""
+    body.seek(0)
+    head = body.read(size)
+    body.seek(0)
+    return head
+
+
+def _guess_type(content_type, read_head, uri):
+    """
+    Guesses the (mimetype, extension) of a resource using `default_resolver`, warning if no extension can be found for
+    it. `read_head` is a callable returning the leading bytes of the resource; it is only called if they are needed.
+    `uri` is used for its extension, and for reporting.
+    """
+    with current_observer().phase('detect', uri) as span:
+        mime, ext = default_resolver.resolve(content_type, read_head, uri)
+        span.details['mimetype'] = mime
+
+    if ext is None:
+        # This mime type will probably need to be added to our hard-coded list at the top of the file.
+        import warnings
+        warnings.warn("Couldn't determine meaning of the {0} content-type "
+                      "associated with the URI {1}".format(mime, uri), RuntimeWarning)
+
+    return mime, ext
+
+
+class _ChunkReader(io.RawIOBase):
+    """A read-only binary file object over an iterator of byte chunks, such as the one returned by `_iter_body`."""
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._pending = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._pending:
+            try:
+                self._pending = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._chunks.close()
+        super().close()
+
+
+class LazyResource:
+    """
+    A lazy handle on the resource at a URI. Nothing is downloaded until the resource is read.
+
+    Parameters
+    ----------
+    uri: str
+        The URI of the resource.
+    sizeout: int
+        The maximum number of bytes that will be read from the resource, past which a FileTooLargeException is raised.
+    """
+    __slots__ = ('uri', 'sizeout', 'closed', '_stream')
+
+    def __init__(self, uri, sizeout=None):
+        self.uri = uri
+        self.sizeout = sizeout
+        self.closed = False
+        self._stream = None
+
+    def open(self):
+        """
+        Sends a new GET request for the resource and returns a binary file object which reads its body off of the wire
+        from the start as it is read. Use this to read the resource again; closing the file is up to the caller.
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed resource.")
+        r = _session().get(self.uri, stream=True)
+        _raise_for_status(r)
+        return io.BufferedReader(_ChunkReader(_iter_body(r, sizeout=self.sizeout)), CHUNK_SIZE)
+
+    def read(self, size=-1):
+        """
+        Reads and returns up to `size` bytes of the resource, or the rest of it if `size` is negative, carrying on from
+        where the last read left off. The GET request is sent on the first read.
+        """
+        if self._stream is None:
+            self._stream = self.open()
+        return self._stream.read(size)
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return "<LazyResource {0!r}>".format(self.uri)
+
+
+class Record(Mapping):
+    """
+    A compact, read-only document describing one dataset in a resource. Records behave like the dictionaries `get`
+    otherwise returns, with the keys "data", "filepath", "mimetype" and "extension", but take up a fraction of the
+    memory.
+    """
+    __slots__ = ('data', 'filepath', 'mimetype', 'extension')
+
+    def __init__(self, data, filepath, mimetype, extension):
+        self.data = data
+        self.filepath = filepath
+        self.mimetype = mimetype
+        self.extension = extension
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __repr__(self):
+        return "Record({0})".format(", ".join("{0}={1!r}".format(key, self[key]) for key in self.__slots__))
+
+
+class _Budget:
+    """
+    The part of a sizeout budget which is left over while an archive is being read. Guards against ZIP bombs: the
+    budget covers the decompressed size of the archive contents, at any depth. The archive itself isn't charged to it,
+    since it was already checked against the sizeout when it was downloaded (or, if it is local, opened).
+    """
+    __slots__ = ('uri', 'sizeout', 'remaining')
+
+    def __init__(self, uri, sizeout=None):
+        self.uri = uri
+        self.sizeout = sizeout
+        self.remaining = sizeout
+
+    def spend(self, size):
+        if not self.sizeout:
+            return
+        self.remaining -= size
+        if self.remaining < 0:
+            raise FileTooLargeException("The contents of the archive at {0} exceed the sizeout of {1} bytes.".format(
+                self.uri, self.sizeout
+            ))
+
+
+class _Replay(io.RawIOBase):
+    """
+    A read-only binary file object which replays the bytes already read off of the start of a stream, then reads the
+    rest of the stream.
+    """
+    def __init__(self, head, rest):
+        self._head = memoryview(head)
+        self._rest = rest
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._head:
+            n = min(len(b), len(self._head))
+            b[:n] = self._head[:n]
+            self._head = self._head[n:]
+            return n
+        data = self._rest.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+class _Metered(io.RawIOBase):
+    """
+    A read-only binary file object over the stream `f` which reports each span of bytes read through it, as a (start,
+    end) pair of offsets, to `charge`. Closing it closes `f`.
+    """
+    def __init__(self, f, charge):
+        self._f = f
+        self._charge = charge
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._f.read(len(b))
+        self._charge(self._position, self._position + len(data))
+        self._position += len(data)
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+
+class _MeteredMember:
+    """
+    Opens an archive member whose size isn't known up front (the file inside of a gzip file, say) so that reading it is
+    charged to the budget of its archive. Each byte is only charged the first time it is read, however many times the
+    member is opened.
+    """
+    def __init__(self, opener, budget):
+        self._opener = opener
+        self._budget = budget
+        self._charged = 0
+
+    def __call__(self):
+        return io.BufferedReader(_Metered(self._opener(), self._charge), CHUNK_SIZE)
+
+    def _charge(self, start, end):
+        if end > self._charged:
+            self._budget.spend(end - max(start, self._charged))
+            self._charged = end
+
+
+class _Cursor(io.RawIOBase):
+    """
+    An independent read position in a seekable binary file which is shared with other cursors. Reads seek the shared
+    file to the cursor's position first, under the given lock.
+    """
+    def __init__(self, f, lock):
+        self._f = f
+        self._lock = lock
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        with self._lock:
+            self._f.seek(self._position)
+            data = self._f.read(len(b))
+        b[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_END:
+            with self._lock:
+                base = self._f.seek(0, os.SEEK_END)
+        else:
+            base = {os.SEEK_SET: 0, os.SEEK_CUR: self._position}[whence]
+        self._position = max(base + offset, 0)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+def _rewind(f, head):
+    """
+    Returns a binary file object reading the stream `f` from its start, given the bytes already read off of it (None if
+    nothing was).
+    """
+    if not head:
+        return f
+    try:
+        if f.seekable():
+            f.seek(0)
+            return f
+    except AttributeError:
+        # Members of streamed TAR files can't even say whether or not they are seekable.
+        pass
+    return io.BufferedReader(_Replay(head, f), CHUNK_SIZE)
+
+
+def _sniff_mime(head, name):
+    """The mimetype of the archive member with the given name and leading bytes. Runs on the classification pool."""
+    return default_resolver.resolve(None, head, name)[0]
+
+
+def _member_extension(path):
+    """The extension of the archive member at the given path, or None if its name doesn't have one."""
+    basename = posixpath.basename(path)
+    return basename.split(".")[-1] if "." in basename else None
+
+
+def _find_reader(path, mime, ext):
+    """The `ArchiveReader` for the file at the given path or URI, or None if it is not an archive."""
+    return archives.find_reader(posixpath.basename(urlsplit(path).path), ext, mime)
+
+
+def _walk_archive(reader, f, reopen, persistent, path, depth, budget, sniff_size=SNIFF_SIZE, max_depth=MAX_DEPTH,
+                  listing=None):
+    """
+    Walks the archive read by `reader` out of the binary file object `f`, recursing into any archives nested inside of
+    it, down to `max_depth` levels deep. Yields a (filepath, mimetype, extension, head, size, fileobj, reopen) tuple
+    for each file found along the way; `head` is the first `sniff_size` bytes of the file (None if they weren't needed),
+    and `fileobj` reads the file from its start, and is only valid until the next file is yielded. See
+    `ArchiveReader.members` for the rest. Nested archives are read as streams, so nothing is written to disk.
+
+    The mimetype is None if it still has to be determined from `head`, which is left to the caller so that it can be
+    done in parallel. Files whose extension is in `extension_map` aren't looked at at all, while files without an
+    extension are classified straight away, since that is the only way to tell whether or not they are archives. If a
+    `listing` mapping filepaths to their known (mimetype, extension) is passed, it is used instead, and the files which
+    aren't listed are skipped.
+    """
+    for name, size, member, reopen_member in reader.members(f, reopen, persistent):
+        filepath = archives.member_path(path, reader, name)
+
+        if listing is not None and (filepath or ".") in listing:
+            mime, ext = listing[filepath or "."]
+            yield filepath or ".", mime, ext, None, size, member, reopen_member
+            continue
+
+        # The leading bytes of the file are only read if its extension doesn't settle what it is.
+        head = None
+        ext = _member_extension(filepath)
+        if ext is not None:
+            mime = default_resolver.lookup_extension(ext)
+        else:
+            # Whether or not a file with no extension is an archive can only be told from its contents.
+            head = member.read(sniff_size)
+            mime = _sniff_mime(head, filepath)
+            ext = default_resolver.extension_for(mime)
+
+        if listing is not None:
+            nested = _find_reader(filepath, mime, ext)
+            if nested is None:
+                continue
+        else:
+            nested = _find_reader(filepath, mime, ext) if depth < max_depth else None
+
+        if nested is not None:
+            # Nested archives count towards the budget like any other file: up front if their size is known, and as
+            # they are read otherwise, so that a reader which has to buffer one (a ZIP file read out of a stream, say)
+            # can't be made to buffer more than the budget allows.
+            nested_f = _rewind(member, head)
+            if size is not None:
+                budget.spend(size)
+            elif budget.sizeout:
+                nested_f = io.BufferedReader(_Metered(nested_f, lambda start, end: budget.spend(end - start)),
+                                             CHUNK_SIZE)
+            yield from _walk_archive(nested, nested_f, reopen_member, False, filepath, depth + 1, budget,
+                                     sniff_size=sniff_size, max_depth=max_depth, listing=listing)
+        else:
+            if size is not None:
+                budget.spend(size)
+            if mime is None and head is None:
+                head = member.read(sniff_size)
+            yield filepath or ".", mime, ext, head, size, _rewind(member, head), reopen_member
+
+
+class _SharedArchive:
+    """
+    The file an archive was read out of, shared between the `ArchiveMember` handles on its contents. The file is
+    closed once every member handle has been closed.
+    """
+    def __init__(self, source, members=0):
+        self.source = source
+        self.open_members = members
+
+    def release(self):
+        self.open_members -= 1
+        if self.open_members <= 0:
+            self.source.close()
+
+
+class ArchiveMember:
+    """
+    A lazy handle on a single file inside of an archive, possibly nested inside of further archives. Nothing is
+    decompressed until the member is read.
+
+    Parameters
+    ----------
+    archive: _SharedArchive
+        The archive the member belongs to.
+    name: str
+        The path to the member within the archive.
+    size: int
+        The decompressed size of the member, in bytes, or None if the archive doesn't record it.
+    opener: callable
+        Returns a new binary file object reading the member.
+    """
+    __slots__ = ('_archive', 'name', 'size', '_opener', 'closed', '_stream')
+
+    def __init__(self, archive, name, size, opener):
+        self._archive = archive
+        self.name = name
+        self.size = size
+        self._opener = opener
+        self.closed = False
+        self._stream = None
+
+    def open(self):
+        """
+        Returns a new binary file object which decompresses the member from the start as it is read. Use this to read
+        the member again; closing the file is up to the caller.
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed archive member.")
+        return self._opener()
+
+    def read(self, size=-1):
+        """
+        Decompresses and returns up to `size` bytes of the member, or the rest of it if `size` is negative, carrying on
+        from where the last read left off.
+        """
+        if self._stream is None:
+            self._stream = self.open()
+        return self._stream.read(size)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            if self._stream is not None:
+                self._stream.close()
+                self._stream = None
+            self._archive.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return "<ArchiveMember {0!r}>".format(self.name)
+
+
+def _copy_member(f, spool, size, budget):
+    """
+    Appends the archive member read by `f` to the given spool file, charging it to the budget as it goes if its size
+    wasn't known up front, and returns the (offset, length) it was written at.
+    """
+    offset = spool.tell()
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if size is None:
+            budget.spend(len(chunk))
+        spool.write(chunk)
+    return offset, spool.tell() - offset
+
+
+def _read_archive(uri, reader, source, sizeout=None, in_archive=False, sniff_size=SNIFF_SIZE, max_depth=MAX_DEPTH,
+                  executor=None, listing=None):
+    """
+    Reads the archive in the given seekable binary file using the given `ArchiveReader`, returning a list of documents
+    for the files inside of it and of the archives nested inside of it (see `get`). `uri` is the URI the archive was
+    read from.
+
+    If `in_archive` is set the documents hold `ArchiveMember` handles, and `source` is kept open until they have all
+    been closed. Otherwise the files are decompressed one after another into a single anonymous temporary file, which
+    is memory-mapped once the walk is done, with each document holding a `MappedFile` view of its own part of it; that
+    way an archive of thousands of files holds one file descriptor rather than one per file. `source` is then closed
+    straight away. Files are classified on the given `concurrent.futures.Executor`, if any, while
+    the walk through the archive carries on; the documents are returned in archive order regardless. See
+    `_walk_archive` for `listing`.
+    """
+    archive = _SharedArchive(source)
+    budget = _Budget(uri, sizeout)
+    lock = threading.Lock()
+    ret = []
+    pending = collections.deque()
+    spool = None if in_archive else tempfile.TemporaryFile()
+    spans = []
+    with current_observer().phase('archive', uri) as span:
+        try:
+            for filepath, mime, ext, head, size, f, reopen in _walk_archive(
+                    reader, source, lambda: io.BufferedReader(_Cursor(source, lock), CHUNK_SIZE), True, "", 0, budget,
+                    sniff_size=sniff_size, max_depth=max_depth,
+                    listing=None if listing is None else {filepath: (mime, ext) for filepath, mime, ext in listing}
+            ):
+                if in_archive:
+                    # Members whose size wasn't known up front are charged to the budget as they are read instead.
+                    opener = _MeteredMember(reopen, budget) if size is None and sizeout else reopen
+                    data = ArchiveMember(archive, filepath, size, opener)
+                else:
+                    # The view of the spool is only made once everything has been written to it, below.
+                    data = None
+                    spans.append(_copy_member(f, spool, size, budget))
+                doc = {'data': data, 'filepath': filepath, 'mimetype': mime, 'extension': ext}
+                ret.append(doc)
+
+                if mime is None:
+                    if executor is None:
+                        doc['mimetype'] = _sniff_mime(head, filepath)
+                    else:
+                        pending.append((doc, executor.submit(_sniff_mime, head, filepath)))
+                        # Don't let the heads of the files pile up in memory faster than they can be classified.
+                        if len(pending) > CLASSIFY_BACKLOG:
+                            doc, future = pending.popleft()
+                            doc['mimetype'] = future.result()
+
+            for doc, future in pending:
+                doc['mimetype'] = future.result()
+
+            if spool is not None:
+                spool.flush()
+                shared = memoryview(MappedFile._mmap(spool))
+                for doc, (offset, length) in zip(ret, spans):
+                    doc['data'] = MappedFile._view(doc['filepath'], shared[offset:offset + length])
+                shared.release()
+        except BaseException:
+            for _, future in pending:
+                future.cancel()
+            for doc in ret:
+                if doc['data'] is not None:
+                    doc['data'].close()
+            source.close()
+            raise
+        finally:
+            # The mapping holds onto the file for as long as any of the views of it are still around.
+            if spool is not None:
+                spool.close()
+        span.details['members'] = len(ret)
+
+    archive.open_members = len(ret)
+    if not in_archive or not ret:
+        source.close()
+    return ret
+
+
+def _read_prefix(r, size):
+    """Reads (at most) the first `size` bytes of the body of the given (`stream=True`) response."""
+    head = bytearray()
+    for chunk in r.iter_content(chunk_size=min(size, CHUNK_SIZE)):
+        head += chunk
+        if len(head) >= size:
+            break
+    return bytes(head[:size])
+
+
+def sniff(uri, sniff_size=SNIFF_SIZE):
+    """
+    Determines the type of the resource at the given URI without downloading all of it. Only the response headers
+    are read if the content-type header is informative enough; otherwise the first `sniff_size` bytes of the body are
+    requested using an HTTP Range request, and handed to `magic`. If the server ignores the Range request the
+    response is streamed instead, and the connection is dropped as soon as enough of the body has arrived.
+
+    Parameters
+    ----------
+    uri: str (required)
+        The URI corresponding with the result download link.
+    sniff_size: int
+        The number of leading bytes of the resource to use for type detection.
+
+    Returns
+    -------
+    A (mimetype, extension) tuple. This may be passed to `get` as `type_hints` if the resource turns out to be wanted.
+    """
+    with current_observer().phase('sniff', uri):
+        r = _session().get(uri, headers={'Range': 'bytes=0-{0}'.format(sniff_size - 1)}, stream=True)
+        try:
+            return _guess_type(r.headers.get('content-type'), lambda: _read_prefix(r, sniff_size), uri)
+        finally:
+            r.close()
+
+
+class MappedFile:
+    """
+    A read-only, memory-mapped local file. The contents of the file are paged in by the operating system as they are
+    accessed, rather than being copied into memory up front; `buffer` is a zero-copy view of them. MappedFile objects
+    are binary file objects, and for compatibility with code written against the requests Response objects `get`
+    otherwise returns, also have `ok`, `status_code` and `content` attributes.
+
+    Parameters
+    ----------
+    path: str
+        The path to the file.
+    f: file object
+        An open binary file to map, such as an anonymous temporary file, in place of the file at `path`. `path` is then
+        only used to describe the file.
+
+    MappedFile objects may also be views of a part of a mapping shared with others (see `_read_archive`). Closing one
+    of those merely lets go of its part; the mapping is unmapped once all of them have been closed or collected.
+    """
+    __slots__ = ('path', 'closed', '_map', '_position')
+    ok = True
+    status_code = 200
+
+    def __init__(self, path, f=None):
+        self.path = path
+        self.closed = False
+        self._position = 0
+        if f is None:
+            with open(path, 'rb') as f:
+                self._map = self._mmap(f)
+        else:
+            self._map = self._mmap(f)
+
+    @classmethod
+    def _view(cls, path, buffer):
+        """A MappedFile reading the given memoryview of a part of a shared mapping, rather than a file of its own."""
+        self = cls.__new__(cls)
+        self.path = path
+        self.closed = False
+        self._position = 0
+        self._map = buffer
+        return self
+
+    @staticmethod
+    def _mmap(f):
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped.
+            return b""
+
+    @property
+    def buffer(self):
+        """A zero-copy memoryview of the contents of the file."""
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        return memoryview(self._map)
+
+    @property
+    def content(self):
+        """A copy of the contents of the file, as bytes."""
+        return bytes(self.buffer)
+
+    def read(self, size=-1):
+        buffer = self.buffer
+        end = len(buffer) if size is None or size < 0 else min(self._position + size, len(buffer))
+        data = bytes(buffer[self._position:end])
+        self._position = max(end, self._position)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._position, os.SEEK_END: len(self)}[whence]
+        self._position = max(base + offset, 0)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            if isinstance(self._map, memoryview):
+                self._map.release()
+            elif isinstance(self._map, mmap.mmap):
+                try:
+                    self._map.close()
+                except BufferError:
+                    # Views of the mapping are still being held onto; it will be unmapped once they are let go of.
+                    pass
+
+    def __len__(self):
+        return len(self._map)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return "<MappedFile {0!r}>".format(self.path)
+
+
+def _pread_head(path, size=SNIFF_SIZE):
+    """Reads the first `size` bytes of the local file at the given path, without going through a buffered file."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.pread(fd, size, 0)
+    finally:
+        os.close(fd)
+
+
+def _get_local(uri, filepath_hint, sizeout=None, type_hints=(None, None), in_archive=False, sniff_size=SNIFF_SIZE,
+               max_depth=MAX_DEPTH, executor=None):
+    """
+    The `file://` branch of `get`. The file is checked against the sizeout using its size on disk, is classified using
+    only its first `sniff_size` bytes, and is returned as a `MappedFile`, so that reading a directory of large local
+    files doesn't cost memory equal to their total size.
+    """
+    path = url2pathname(urlsplit(uri).path)
+    if sizeout and os.path.getsize(path) > sizeout:
+        raise FileTooLargeException("The file at {0} exceeds the sizeout of {1} bytes.".format(uri, sizeout))
+
+    if type_hints != (None, None):
+        mime, ext = type_hints
+    else:
+        mime, ext = _guess_type(None, lambda: _pread_head(path, sniff_size), uri)
+
+    reader = _find_reader(uri, mime, ext)
+    if reader is not None:
+        return _read_archive(uri, reader, open(path, 'rb'), sizeout=sizeout, in_archive=in_archive,
+                             sniff_size=sniff_size, max_depth=max_depth, executor=executor)
+    else:
+        with current_observer().phase('map', uri) as span:
+            data = MappedFile(path)
+            span.details['bytes'] = len(data)
+        return [{'data': data, 'filepath': filepath_hint, 'mimetype': mime, 'extension': ext}]
+
+
+def _get_cached(uri, cache, sizeout=None, type_hints=(None, None), sniff_size=SNIFF_SIZE, max_depth=MAX_DEPTH,
+                executor=None):
+    """
+    The `cache` branch of `get`. If the cache has an entry for the URI, it is revalidated with a conditional GET
+    request, and if the server reports that the resource hasn't changed, the documents are rebuilt from the cached body
+    and listing without any further classification. Otherwise the body is downloaded into the cache, classified, and
+    stored along with its listing and validators.
+    """
+    observer = current_observer()
+    entry = cache.lookup(uri)
+    with observer.phase('revalidate', uri):
+        r = _session().get(uri, headers=cache.validators(entry) if entry else {}, stream=True)
+
+    if entry is not None and r.status_code == 304:
+        r.close()
+        observer.event('cache_hit', uri, bytes=entry['size'])
+        if sizeout and entry['size'] > sizeout:
+            raise FileTooLargeException("The resource at {0} exceeds the sizeout of {1} bytes.".format(uri, sizeout))
+        body = open(cache.path(entry), 'rb')
+        if entry['archive']:
+            return _read_archive(uri, _find_reader(uri, *entry['archive']), body, sizeout=sizeout, in_archive=True,
+                                 sniff_size=sniff_size, max_depth=max_depth, executor=executor,
+                                 listing=entry['listing'])
+        else:
+            [(filepath, mime, ext)] = entry['listing']
+            return [{'data': body, 'filepath': filepath, 'mimetype': mime, 'extension': ext}]
+
+    # Error pages mustn't find their way into the cache.
+    _raise_for_status(r)
+
+    observer.event('cache_miss', uri)
+    with observer.phase('transfer', uri) as span:
+        digest, size = cache.ingest(_iter_body(r, sizeout=sizeout))
+        span.details['bytes'] = size
+    # The ingested body is held by the cache until it's stored (or, should anything go wrong, deleted) here.
+    try:
+        body = open(cache.path({'digest': digest}), 'rb')
+        try:
+            if type_hints != (None, None):
+                mime, ext = type_hints
+            else:
+                mime, ext = _guess_type(r.headers.get('content-type'), lambda: _read_head(body, sniff_size), uri)
+
+            reader = _find_reader(uri, mime, ext)
+            if reader is not None:
+                ret = _read_archive(uri, reader, body, sizeout=sizeout, in_archive=True, sniff_size=sniff_size,
+                                    max_depth=max_depth, executor=executor)
+            else:
+                filepath_hint = uri.replace("file://", "") if "file://" in uri else "."
+                ret = [{'data': body, 'filepath': filepath_hint, 'mimetype': mime, 'extension': ext}]
+
+            cache.store(uri, digest, size, r.headers,
+                        [(doc['filepath'], doc['mimetype'], doc['extension']) for doc in ret],
+                        archive=(mime, ext) if reader is not None else None)
+        except BaseException:
+            body.close()
+            raise
+    finally:
+        cache.release(digest)
+    return ret
+
+
+def get(uri, sizeout=None, type_hints=(None, None), stream=False, in_archive=False, sniff_size=SNIFF_SIZE, lazy=False,
+        cache=None, connections=1, max_depth=MAX_DEPTH, executor=None, observer=None):
     """
     Given the download URI for a resource, returns a list of (data, filepath_hint, type_hint) tuples corresponding with
     that resource's dataset contents. Note that in some cases None will substitute for `data` in the above, and that in
@@ -49,134 +1168,237 @@ def get(uri, sizeout=None, type_hints=(None, None), localized=False):
     sizeout: int
         Before sending a download request this method will first ask the server for the content-length header of the
         download. If one is provided, and exceeds this parameter in size (in number of bytes), this method will raise a
-        FileSizeTooLarge exception. This parameter will be ignored if the resource is a file.
+        FileSizeTooLarge exception. The same byte budget is enforced while the body is downloading, whether or not a
+        content-length was provided (and for local files too), and against the total uncompressed size of the files
+        inside of an archive, including those inside of nested archives.
     type_hints: (str, str) tuple
         Type hint for the dataset's type, in the form of a (mimetype, extension) tuple. If this information is
         passed, the method will return this information in the output. If it is not passed, get will attempt to
         determine this metadata itself.
-    localized: bool
-        Whether or not this file is a local file (e.g. a downloaded file that's sitting on your computer disk). This
-        flag should only be used when `get` calls itself recursively; it shouldn't be set by the user!
+    stream: bool
+        Whether or not to stream the resource. By default the entire response body is read into memory. If this flag
+        is set the body is instead spooled to an anonymous temporary file in chunks of `CHUNK_SIZE` bytes, and type
+        detection and archive expansion are run off of that file, so that peak memory usage stays flat no matter how
+        large the resource is.
+    in_archive: bool
+        Whether or not to read the contents of archives in place. Archives (ZIP, KMZ, TAR, and gzip, bzip2 or xz
+        compressed files, as well as any further formats registered with `datafy.archives.register_reader`) are read
+        as streams, and the archives nested inside of them are recursed into without being written to disk. By default
+        each file found is decompressed into an anonymous temporary file, which is returned memory-mapped as a
+        `MappedFile`. If this flag is set the archive is instead kept open, and an `ArchiveMember` handle which
+        decompresses the member only once it is read is returned in the "data" field of each document. Close the
+        handles when done with them to release the archive. Either way each file is classified using its first few
+        bytes, and its "filepath" is its path within the archive, of the form "outer.zip/inner.tar/data.csv" for files
+        inside of nested archives.
+    sniff_size: int
+        The number of leading bytes of the resource (or of each archive member, if `in_archive` is set) handed to
+        `magic` when the type of the resource isn't evident from its content-type header. Use `sniff` to classify a
+        resource before committing to downloading it.
+    lazy: bool
+        Whether or not to defer downloading the resource until its data is accessed. If this flag is set the resource
+        is classified using `sniff`, and a `LazyResource` handle which only sends a GET request once it is read is
+        returned in the "data" field. Archives still have to be downloaded to be listed, but are read as if `stream`
+        and `in_archive` were set. Local (file://) resources are memory-mapped as usual, which defers reading them just
+        the same. The documents are returned as compact, read-only `Record` mappings.
+    cache: datafy.Cache
+        A persistent on-disk cache to read the resource through. If the cache already holds the resource it is
+        revalidated with a conditional request, and if it hasn't changed since, nothing is downloaded or classified
+        again. The resource is read as if `stream` and `in_archive` were set, with the "data" field holding a binary
+        file object reading the cached body, or `ArchiveMember` handles on its contents. HTTP errors are raised as
+        `requests.HTTPError`, rather than cached.
+    connections: int
+        The number of concurrent connections to download the resource over. If this is more than one, and the server
+        advertises support for Range requests, the resource is split into that many byte ranges which are downloaded
+        in parallel into a preallocated temporary file, and read as if `stream` were set. A range whose connection
+        drops partway through is resumed from where it left off. Servers which don't support Range requests fall back
+        to a single stream, which is spooled to a temporary file all the same.
+    max_depth: int
+        The number of levels of archives nested inside of the resource to read into. Archives nested any deeper are
+        returned as they are, like any other file.
+    executor: concurrent.futures.Executor
+        A thread or process pool to classify the files inside of archives on, while the archive is read on. Each
+        thread gets a libmagic handle of its own, so threads classify files in parallel, but this only pays off on a
+        machine with cores to spare and for archives of many files which need `magic`: handing small files to a pool
+        can cost more than classifying them in line, and more so with a process pool, which copies each file's head
+        to the worker. The documents are returned in archive order regardless. Files whose extension is in
+        `extension_map`, such as the sidecar files of shapefiles, are never handed to `magic` at all.
+    observer: datafy.Observer
+        An observer to report the phases of this call to (the HEAD probe, the transfer, type detection, archive
+        expansion and so on), along with their durations, the number of bytes transferred, the number of files found
+        in archives, cache hits and retries. Defaults to the observer installed with `datafy.observe`, if any.
 
     Returns
     -------
     A list of documents of the form [{'data': r, 'filepath': filepath_hint, 'mimetype': mime, 'extension': ext}, ...].
-    May raise a FileSizeTooLarge along the way. A requests Request object is returned in the "data" field.
+    May raise a FileSizeTooLarge along the way. A requests Request object is returned in the "data" field. If `stream`
+    is set, a binary file object positioned at the start of the spooled body is returned in the "data" field instead;
+    since that has no status to check, error responses raise a `requests.HTTPError` rather than being spooled. Local
+    (file://) resources are memory-mapped rather than read, and a `MappedFile` is returned in the "data" field.
     """
+    with observe(observer) if observer is not None else contextlib.nullcontext():
+        with current_observer().phase('get', uri) as span:
+            ret = _get(uri, sizeout=sizeout, type_hints=type_hints, stream=stream, in_archive=in_archive,
+                       sniff_size=sniff_size, lazy=lazy, cache=cache, connections=connections, max_depth=max_depth,
+                       executor=executor)
+            span.details['documents'] = len(ret)
+        return ret
+
+
+def _get(uri, sizeout=None, type_hints=(None, None), stream=False, in_archive=False, sniff_size=SNIFF_SIZE, lazy=False,
+         cache=None, connections=1, max_depth=MAX_DEPTH, executor=None):
+    """The body of `get`, which see."""
+    observer = current_observer()
+
+    # Cached resources are revalidated with a conditional GET request instead, which is as cheap as a HEAD request if
+    # nothing has changed. The sizeout is then enforced while the body downloads.
+    if cache is not None:
+        return _get_cached(uri, cache, sizeout=sizeout, type_hints=type_hints, sniff_size=sniff_size,
+                           max_depth=max_depth, executor=executor)
+
     # First send a HEAD request and back out if sizeout is exceeded. Don't do this if the file is local.
     if "file://" not in uri and sizeout:
         try:
-            content_length = int(requests.head(uri, timeout=1).headers['content-length'])
+            with observer.phase('head', uri):
+                # requests doesn't follow redirects on HEAD requests unless told to, and the headers of a redirect say
+                # nothing about the size of the resource behind it.
+                content_length = int(_session().head(uri, allow_redirects=True).headers['content-length'])
             if content_length > sizeout:
                 raise FileTooLargeException
 
         except KeyError:
             pass
 
-    # Then send a GET request.
-    r = requests_session.get(uri)
-
-    # If a type hint is passed from above, use that.
-    if type_hints != (None, None):
-        mime, ext = type_hints
-
-    # If no type hint is provided we have to guess the file type ourselves. This is a two-step process.
-    else:
+    # If the URI contains a "file://" in front, we know that this piece of data was read out of an archival file format.
+    # In that case, we need to pull in a filepath hint so that we can point to which specific file in the resource is
+    # the dataset of interest. Otherwise, the entire resource is itself the dataset of interest, and we denote the path
+    # with a ".".
+    filepath_hint = uri.replace("file://", "") if "file://" in uri else "."
 
-        # First, we check the result's mimetype against a map of known mimetypes (`mime_map`, above) in order to catch
-        # obvious inputs. We can't account for every possible input, however, so this doesn't catch everything.
+    # Local files are read natively, rather than through the requests session. They are memory-mapped, which already
+    # defers reading them until their data is accessed, so in lazy mode there's nothing else to do but to read
+    # archives in place.
+    if uri.startswith("file://"):
+        ret = _get_local(uri, filepath_hint, sizeout=sizeout, type_hints=type_hints, in_archive=in_archive or lazy,
+                         sniff_size=sniff_size, max_depth=max_depth, executor=executor)
+        return [Record(**doc) for doc in ret] if lazy else ret
 
-        try:
-            split = r.headers['content-type'].split()
-            mime = split[0].replace(";", "")
-            ext = mime_map[mime]
-        except KeyError:
+    # In lazy mode, nothing is downloaded up front unless it has to be. The type of the resource is determined using
+    # its headers and, if need be, the first few bytes of it; unless it turns out to be an archive, that is all.
+    # Archives have to be downloaded to be listed, but their contents are read in place and lazily.
+    if lazy:
+        if type_hints == (None, None):
+            type_hints = sniff(uri, sniff_size=sniff_size)
+        if _find_reader(uri, *type_hints) is None:
+            return [Record(LazyResource(uri, sizeout=sizeout), filepath_hint, *type_hints)]
+        stream = in_archive = True
 
-            # If we get an object type that we don't get using the procedure above, we'll use an oracle to try to get
-            # it. An oracle alone isn't enough, because it would e.g. report a CSV document as text/plain, which is
-            # unhelpful. This is why the step above is necessary. However, an oracle (the `magic` library in this case)
-            # always generates some kind of guess; the base case in the case of scrambled binary seems to be to guess
-            # `.bat`.
-            #
-            # Usually files transferred without an obvious mimetype do so as an application/octet-stream,
-            mime = magic.from_buffer(r.content, mime=True)
+    # Then send a GET request. If we are streaming, spool the body to disk as it comes in; otherwise read it into
+    # memory. Either way the body is read as a stream, so that it can be cut off as soon as it goes over the sizeout
+    # (the content-length header may be missing or wrong, for chunked and compressed transfers), and so that a
+    # connection which drops partway through is resumed under the transport policy. Large resources can instead be
+    # downloaded in parallel byte ranges, if the server supports it.
+    with observer.phase('transfer', uri) as span:
+        ranged = _spool_ranges(uri, connections, sizeout=sizeout) if connections > 1 else None
+        if ranged is not None:
+            headers, body = ranged
+            stream = True
+            span.details['connections'] = connections
+        else:
+            # Callers asking for several connections get a spooled file back either way, not only when the server
+            # happens to support Range requests.
+            stream = stream or connections > 1
+            r = _session().get(uri, stream=True)
+            headers = r.headers
+            if stream:
+                _raise_for_status(r)
+                body = _spool(r, sizeout=sizeout)
+            else:
+                body = None
+                _load(r, sizeout=sizeout)
+        if observer.enabled:
+            span.details['bytes'] = os.fstat(body.fileno()).st_size if stream else len(r.content)
 
-            try:
-                ext = mime_map[mime]
-            except KeyError:
-                try:
-                    ext = mimetypes.guess_extension(mime)[1:]
-                except TypeError:
-                    # If we still don't have an answer, warn.
-                    # This mime type will probably need to be added to our hard-coded list at the top of the file.
-                    import warnings
-                    warnings.warn("Couldn't determine meaning of the {0} content-type "
-                                  "associated with the URI {1}".format(mime, uri), RuntimeWarning)
-                    ext = None
+    # If a type hint is passed from above, use that. Otherwise we have to guess the file type ourselves.
+    if type_hints != (None, None):
+        mime, ext = type_hints
+    else:
+        mime, ext = _guess_type(headers.get('content-type'),
+                                (lambda: _read_head(body, sniff_size)) if stream else (lambda: r.content[:sniff_size]),
+                                uri)
 
     # TODO: It may prove necessary to guess encoding information as well. If so, investigate using chardet.
 
-    # If the URI contains a "file://" in front, we know that this piece of data was read out of an archival file format.
-    # In that case, we need to pull in a filepath hint so that we can point to which specific file in the resource is
-    # the dataset of interest. Otherwise, the entire resource is itself the dataset of interest, and we denote the path
-    # with a ".".
-    filepath_hint = uri.replace("file://", "") if "file://" in uri else "."
+    reader = _find_reader(uri, mime, ext)
+    if reader is not None:
+        source = body if stream else io.BytesIO(r.content)
+        ret = _read_archive(uri, reader, source, sizeout=sizeout, in_archive=in_archive, sniff_size=sniff_size,
+                            max_depth=max_depth, executor=executor)
+        return [Record(**doc) for doc in ret] if lazy else ret
+    else:
+        return [{'data': body if stream else r, 'filepath': filepath_hint, 'mimetype': mime, 'extension': ext}]
 
-    # If get is called with the localized flag set to true, we are furthermore operating on a file which has already
-    # been saved to disc using a temporary filename. This was done to simplify the code with it comes to inspecting
-    # archival format files. Since we don't want that temporary path to be included in the filename that we write to
-    # the glossary, we set this flag when that happens in order to remove that component of the path before writing,
-    # as per here.
-    filepath_hint = "/".join(filepath_hint.split("/")[2:]) if localized else filepath_hint
 
-    if ext == "zip":
+def get_many(uris, max_workers=8, max_per_host=4, sizeout=None, **kwargs):
+    """
+    Runs `get` over a list of URIs concurrently, on a pool of threads sharing the connection pool of
+    `requests_session`. This is much faster than calling `get` in a loop when crawling a large catalog, because the
+    round-trip latency of each HEAD and GET request overlaps with the others.
 
-        # In certain cases, it's possible to the contents of an archive virtually. This depends on the contents of the
-        # file: shapefiles can't be read because they are split across multiple files, KML and KMZ files can't be read
-        # because fiona doesn't support them. But most of the rest of things can be.
+    Parameters
+    ----------
+    uris: list of str (required)
+        The URIs to fetch.
+    max_workers: int
+        The number of URIs which may be fetched at once.
+    max_per_host: int
+        The number of URIs which may be fetched at once from any one host, so that a crawl doesn't hammer any single
+        server with `max_workers` simultaneous connections.
+    sizeout: int
+        Passed through to `get`.
+    kwargs
+        Any other keyword arguments are passed through to `get`.
 
-        # To keep the API simple, however, we're not going to do the three-way fork required to do this. Instead we're
-        # going to take the performance hit of writing to disk in all cases (which is really trivial anyway compared to
-        # the cost of downloading), and analyze that in-place.
+    Returns
+    -------
+    A list with one entry per URI, in the same order as `uris`. Each entry is either the list of documents that `get`
+    returned for that URI, or the exception that `get` raised for it.
+    """
+    _resize_pool(max_workers, max_per_host)
 
-        # This branch will then recursively call get as a subroutine, using the file driver to pick out the rest of the
-        # files in the folder.
+    def fetch(uri):
+        try:
+            return get(uri, sizeout=sizeout, **kwargs)
+        except Exception as e:
+            return e
 
-        # Important limitations: this does not handle ZIP files within ZIP files (yo dawg...). I also have not yet
-        # dealt with TAR files and the like. See this repository's issues for more on this.
-        z = zipfile.ZipFile(io.BytesIO(r.content))
+    # URIs are queued up by host, and a URI is only handed to the pool once its host has a free slot, so that no worker
+    # ever sits waiting on a busy host while URIs for other hosts are left waiting behind it. Hosts with queued URIs
+    # and free slots take turns.
+    queues = collections.OrderedDict()
+    for i, uri in enumerate(uris):
+        queues.setdefault(urlsplit(uri).netloc, collections.deque()).append(i)
+    ready = collections.deque(queues)
+    running = collections.Counter()
+    active = {}
+    results = [None] * len(uris)
 
-        try:
-            while True:
-                temp_foldername = str(random.randint(0, 1000000))  # minimize the chance of a collision
-                if not os.path.exists(temp_foldername):
-                    os.makedirs(temp_foldername)
-                    break
-            z.extractall(path=temp_foldername)
-
-            # Recurse using the file driver to deal with local folders.
-            ret = []
-            working_directory_abs_path = '{0}/{1}'.format(os.getcwd(), temp_foldername)
-            for filename in [name for name in z.namelist() if not os.path.isdir('{0}/{1}'.format(
-                    working_directory_abs_path, name)
-            )]:
-                ext = filename.split(".")[-1]
-                mime = magic.from_file('{0}/{1}'.format(temp_foldername, filename), mime=True)
-
-                # We need to build an absolute filepath and pass that for requests_file to catch.
-                rel_filepath = "{0}/{1}".format(temp_foldername, filename)
-                abs_filepath = os.path.abspath(rel_filepath)
-                ret += get("file://{0}".format(abs_filepath), type_hints=(mime, ext), localized=True)
-        finally:
-            # Delete the folder before returning the data.
-            shutil.rmtree(temp_foldername)
-        return ret
+    # Each URI is fetched in a copy of this thread's context, so that it sees the observer installed here, if any.
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while ready or active:
+            while ready and len(active) < max_workers:
+                host = ready.popleft()
+                i = queues[host].popleft()
+                active[executor.submit(context.copy().run, fetch, uris[i])] = (i, host)
+                running[host] += 1
+                if queues[host] and running[host] < max_per_host:
+                    ready.append(host)
 
-    else:
-        # If we are working with a local file, filepath_hint is an absolute filepath because that is what we needed
-        # to pass to the requests session. But we do not want to include this system-dependent information in the file
-        # paths we return. Therefore, we excise the absolute part out to return us to a relative path.
-        # TODO: Is there a better way of doing this?
-        if localized:
-            filepath_hint= filepath_hint[len(os.path.abspath(".")) + 2:]  # fencepost and exclude the prior slash
-        return [{'data': r, 'filepath': filepath_hint, 'mimetype': mime, 'extension': ext}]
+            done, _ = wait(active, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, host = active.pop(future)
+                results[i] = future.result()
+                running[host] -= 1
+                if queues[host] and running[host] == max_per_host - 1:
+                    ready.append(host)
+        return results
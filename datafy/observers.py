@@ -0,0 +1,180 @@
+"""
+Instrumentation hooks for `get`. An `Observer` is told about each phase of every `get` call (the HEAD probe, the
+transfer, type detection, archive expansion and so on) as it finishes, along with how long it took and what it did,
+and about the events in between, such as cache hits and retried transfers. Pass one to `get` as its `observer`, or
+install one for a whole block of code with `observe`:
+
+    >>> from datafy import get_many, observe, Stats
+    >>> stats = Stats()
+    >>> with observe(stats):
+    ...     get_many(uris)
+    >>> stats.print_summary()
+
+By default nothing is observed, and the hooks cost next to nothing.
+"""
+import bisect
+import collections
+import contextlib
+import contextvars
+import math
+import sys
+import threading
+import time
+
+
+class Observer:
+    """
+    Base class for observers. Subclasses override `on_phase`, `on_event`, or both.
+
+    The phases reported by `get` are "get" (the whole call), "head", "revalidate" (the conditional request made for a
+    resource read through a `Cache`), "transfer", "map" (memory-mapping a local file), "sniff", "detect" and "archive".
+    Their details include the number of bytes transferred ("bytes") and the number of files found inside of archives
+    ("members"). The events are "cache_hit", "cache_miss", "retry" (a request being retried under the transport policy,
+    or a byte range of a parallel download being requested again) and "resume" (a dropped response body being
+    resumed).
+    """
+    # Whether or not the observer wants to be told anything. Phases aren't even timed for observers which don't.
+    enabled = True
+
+    def phase(self, name, uri):
+        """
+        Returns a context manager timing the phase with the given name of the `get` call for the given URI, which
+        reports it to `on_phase` when it exits. Details about the phase can be added to the `details` dictionary of
+        the object the context manager returns.
+        """
+        return _Span(self, name, uri)
+
+    def on_phase(self, name, uri, seconds, details):
+        """Called at the end of each phase, with how long it took in seconds and a dictionary of details about it."""
+
+    def on_event(self, name, uri, details):
+        """Called on each event, with a dictionary of details about it."""
+
+    def event(self, name, uri, **details):
+        """Reports the event with the given name to `on_event`."""
+        if self.enabled:
+            self.on_event(name, uri, details)
+
+
+class NullObserver(Observer):
+    """The default observer, which ignores everything."""
+    enabled = False
+
+    def phase(self, name, uri):
+        return _null_span
+
+
+class _Span:
+    __slots__ = ('observer', 'name', 'uri', 'details', 'start')
+
+    def __init__(self, observer, name, uri):
+        self.observer = observer
+        self.name = name
+        self.uri = uri
+        self.details = {}
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is not None:
+            self.details['error'] = exc_type.__name__
+        self.observer.on_phase(self.name, self.uri, time.perf_counter() - self.start, self.details)
+
+
+class _NullSpan:
+    __slots__ = ()
+    # Shared between every phase that isn't being observed, so details written to it go nowhere.
+    details = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_null_span = _NullSpan()
+_observer = contextvars.ContextVar('datafy_observer', default=NullObserver())
+
+
+def current_observer():
+    """The observer installed in the current context."""
+    return _observer.get()
+
+
+@contextlib.contextmanager
+def observe(observer):
+    """A context manager installing the given observer for the `get` calls made inside of it."""
+    token = _observer.set(observer)
+    try:
+        yield observer
+    finally:
+        _observer.reset(token)
+
+
+class Stats(Observer):
+    """
+    An observer which aggregates what it is told across any number of `get` calls, and summarizes it as a histogram
+    of the durations of each phase. Safe to share between threads.
+    """
+    # Upper bounds of the histogram buckets, in seconds.
+    buckets = (0.001, 0.01, 0.1, 1, 10, 100, math.inf)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = collections.defaultdict(list)
+        self.totals = collections.defaultdict(collections.Counter)
+        self.events = collections.Counter()
+
+    def on_phase(self, name, uri, seconds, details):
+        with self._lock:
+            self.durations[name].append(seconds)
+            for key, value in details.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self.totals[name][key] += value
+
+    def on_event(self, name, uri, details):
+        with self._lock:
+            self.events[name] += 1
+
+    def summary(self):
+        """Returns a dictionary of the count, total, mean, maximum, histogram and totalled details of each phase."""
+        with self._lock:
+            phases = {}
+            for name, durations in self.durations.items():
+                histogram = [0] * len(self.buckets)
+                for seconds in durations:
+                    histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+                phases[name] = {
+                    'count': len(durations),
+                    'total': sum(durations),
+                    'mean': sum(durations) / len(durations),
+                    'max': max(durations),
+                    'histogram': histogram,
+                    'details': dict(self.totals[name])
+                }
+            return {'phases': phases, 'events': dict(self.events)}
+
+    def print_summary(self, file=None):
+        """Prints the summary as a table, with a bar chart of each phase's histogram."""
+        file = sys.stdout if file is None else file
+        summary = self.summary()
+        labels = ["<{0:g}s".format(bound) if bound != math.inf else ">{0:g}s".format(self.buckets[-2])
+                  for bound in self.buckets]
+
+        for name, phase in sorted(summary['phases'].items(), key=lambda item: -item[1]['total']):
+            details = ", ".join("{0}={1:g}".format(key, value) for key, value in sorted(phase['details'].items()))
+            print("{0:<10} {1:>6} calls {2:>10.3f}s total {3:>9.4f}s mean {4:>9.4f}s max  {5}".format(
+                name, phase['count'], phase['total'], phase['mean'], phase['max'], details
+            ), file=file)
+            peak = max(phase['histogram'])
+            for label, count in zip(labels, phase['histogram']):
+                if count:
+                    print("    {0:>8} {1:<40} {2}".format(label, "#" * max(1, round(40 * count / peak)), count),
+                          file=file)
+
+        if summary['events']:
+            print("events     " + ", ".join("{0}={1}".format(name, count)
+                                            for name, count in sorted(summary['events'].items())), file=file)
@@ -0,0 +1,195 @@
+"""
+The type resolver `get` uses to work out the (mimetype, extension) of resources and of the files inside of archives.
+"""
+import collections
+import hashlib
+import mimetypes
+import posixpath
+import threading
+from urllib.parse import urlsplit
+
+
+class TypeResolver:
+    """
+    Works out the (mimetype, extension) of a file from its content-type header, its name and its leading bytes. The
+    rules are tried cheapest first:
+
+    1. The mimetype in the content-type header, if it is in the mime table.
+    2. The extension of the file name, if it is in the extension table.
+    3. The registered magic signatures, matched against the leading bytes of the file.
+    4. The registered rules, which are handed the leading bytes of the file, in the order they were registered.
+    5. The `magic` oracle, whose answers are memoized on the (content-type header, extension, digest of the leading
+       bytes) of the file, so that classifying the same kind of file again is a dictionary lookup.
+
+    The extension that goes with a mimetype found by the oracle is looked up in the mime table, then in the
+    `mimetypes` module. `magic`, and with it libmagic and its database, is only loaded the first time the oracle is
+    consulted.
+
+    Parameters
+    ----------
+    mime_map: dict
+        Maps mimetypes to the extension to report for them. The dictionary is used as is, not copied.
+    extension_map: dict
+        Maps file extensions to the mimetype to report for them, without consulting the oracle. The dictionary is used
+        as is, not copied.
+    memo_size: int
+        The number of oracle answers to remember, past which the least recently used are forgotten.
+    """
+    def __init__(self, mime_map=None, extension_map=None, memo_size=4096):
+        self.mime_map = {} if mime_map is None else mime_map
+        self.extension_map = {} if extension_map is None else extension_map
+        self.memo_size = memo_size
+        self._signatures = []
+        self._signature_table = {}
+        self._rules = []
+        self._memo = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def register_mime(self, mime, extension):
+        """Reports files served with the given mimetype as having the given extension."""
+        self.mime_map[mime] = extension
+        self.clear()
+
+    def register_extension(self, extension, mime):
+        """Reports files with the given extension as having the given mimetype, without consulting the oracle."""
+        self.extension_map[extension.lower()] = mime
+        self.clear()
+
+    def register_signature(self, signature, mime, extension=None, offset=0):
+        """
+        Reports files whose leading bytes hold the given `signature` bytes, starting `offset` bytes in, as having the
+        given mimetype and extension, without consulting the oracle. If no extension is given it is looked up from the
+        mimetype. Longer signatures take precedence over shorter ones.
+        """
+        self._signatures.append((offset, bytes(signature), mime, extension))
+        self._compile()
+        self.clear()
+
+    def register_rule(self, rule):
+        """
+        Registers a rule for recognizing files the signatures can't pin down, without consulting the oracle: a
+        callable which is handed the leading bytes of a file, and returns its (mimetype, extension), or None if it
+        doesn't recognize it. Rules are tried in the order they were registered.
+        """
+        self._rules.append(rule)
+        self.clear()
+
+    def clear(self):
+        """Forgets the memoized oracle answers."""
+        with self._lock:
+            self._memo.clear()
+
+    def _compile(self):
+        # Signatures are grouped by offset and length, longest first, so that matching the leading bytes of a file
+        # against them is a handful of dictionary lookups however many there are.
+        table = {}
+        for offset, signature, mime, extension in self._signatures:
+            table.setdefault((offset, len(signature)), {})[signature] = (mime, extension)
+        self._signature_table = [(offset, length, table[offset, length])
+                                 for offset, length in sorted(table, key=lambda key: -key[1])]
+
+    def extension_for(self, mime):
+        """The extension that goes with the given mimetype, or None if there isn't a known one."""
+        try:
+            return self.mime_map[mime]
+        except KeyError:
+            guess = mimetypes.guess_extension(mime) if mime else None
+            return guess[1:] if guess else None
+
+    def lookup_extension(self, extension):
+        """The mimetype registered for the given extension, or None if there isn't one."""
+        return self.extension_map.get(extension.lower()) if extension else None
+
+    def resolve(self, content_type=None, head=b"", name=None):
+        """
+        Returns the (mimetype, extension) of a file. The extension is None if it can't be determined.
+
+        Parameters
+        ----------
+        content_type: str
+            The content-type header the file was served with, if any.
+        head: bytes or callable
+            The leading bytes of the file, or a callable returning them, which is only called if they are needed.
+        name: str
+            The URI, path or name of the file, if any. Only its extension is used.
+        """
+        # The content-type header, less any parameters.
+        if content_type:
+            mime = content_type.split(";")[0].strip()
+            if mime in self.mime_map:
+                return mime, self.mime_map[mime]
+
+        extension = _extension(name)
+        mime = self.lookup_extension(extension)
+        if mime is not None:
+            return mime, extension
+
+        if callable(head):
+            head = head()
+        for offset, length, signatures in self._signature_table:
+            match = signatures.get(head[offset:offset + length])
+            if match is not None:
+                mime, ext = match
+                return mime, ext if ext is not None else self.extension_for(mime)
+        for rule in self._rules:
+            match = rule(head)
+            if match is not None:
+                return match
+
+        key = (content_type, extension, hashlib.blake2b(head, digest_size=16).digest())
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+
+        # An oracle alone isn't enough, because it would e.g. report a CSV document served as text/csv as text/plain,
+        # which is unhelpful. This is why the steps above are necessary. However, an oracle (the `magic` library in
+        # this case) always generates some kind of guess; the base case in the case of scrambled binary seems to be to
+        # guess `.bat`.
+        mime = self._oracle(head)
+        result = (mime, self.extension_for(mime))
+
+        with self._lock:
+            self._memo[key] = result
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return result
+
+    def _oracle(self, head):
+        # `magic.from_buffer` shares a single libmagic handle between every thread, behind a lock, so files classified
+        # on a pool of threads would be handed to libmagic one at a time. Each thread gets a handle of its own instead.
+        oracle = getattr(self._local, 'magic', None)
+        if oracle is None:
+            import magic
+            oracle = self._local.magic = magic.Magic(mime=True)
+        return oracle.from_buffer(head)
+
+    def resolve_many(self, items, executor=None):
+        """
+        Resolves a batch of files at once, given an iterable of (content_type, head, name) tuples, returning their
+        (mimetype, extension) tuples in the same order. Files which share a memo key are only handed to the oracle
+        once. If a `concurrent.futures.Executor` is given the files are resolved on it.
+        """
+        items = [(content_type, head() if callable(head) else head, name) for content_type, head, name in items]
+        first = {}
+        for content_type, head, name in items:
+            first.setdefault((content_type, _extension(name), hashlib.blake2b(head, digest_size=16).digest()),
+                             (content_type, head, name))
+
+        if executor is None:
+            results = {key: self.resolve(*item) for key, item in first.items()}
+        else:
+            futures = {key: executor.submit(self.resolve, *item) for key, item in first.items()}
+            results = {key: future.result() for key, future in futures.items()}
+
+        return [results[content_type, _extension(name), hashlib.blake2b(head, digest_size=16).digest()]
+                for content_type, head, name in items]
+
+
+def _extension(name):
+    """The extension of the file with the given URI, path or name, or None if it doesn't have one."""
+    if not name:
+        return None
+    basename = posixpath.basename(urlsplit(name).path) if "://" in name else posixpath.basename(name)
+    return basename.split(".")[-1].lower() if "." in basename else None
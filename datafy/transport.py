@@ -0,0 +1,173 @@
+"""
+The transport policy of the requests session `get` downloads through: timeouts, retries with backoff, per-host rate
+limits, and the resumption of bodies whose connection drops partway through. Install a policy with
+`datafy.configure`.
+
+requests and urllib3 aren't imported until the policy is first put to use, so that importing datafy stays cheap.
+"""
+import functools
+import inspect
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+
+from .observers import current_observer
+
+
+class TransportPolicy:
+    """
+    How `get` talks to servers.
+
+    Parameters
+    ----------
+    connect_timeout: float
+        Seconds to wait for a connection to be established before giving up on it.
+    read_timeout: float
+        Seconds to wait for the server to send anything, whether the response headers or the next piece of the body,
+        before giving up on it. A stalled server therefore can't hang a request forever.
+    retries: int
+        The number of times a failed request is retried: connection errors, timeouts, and responses with a status in
+        `retry_statuses`. Only idempotent requests (GET, HEAD and the like) are retried.
+    backoff_factor: float
+        Retries back off exponentially: the n-th retry waits `backoff_factor * 2 ** (n - 1)` seconds, up to
+        `backoff_max`. A Retry-After header sent by the server is honored instead, where there is one.
+    backoff_jitter: float
+        Up to this many seconds of random jitter are added to each backoff, so that the workers of a crawl which were
+        turned away at the same time don't all come back at the same time. Requires urllib3 2; ignored under 1.26.
+    backoff_max: float
+        The longest any one backoff may be, in seconds. Requires urllib3 2; urllib3 1.26 caps backoffs at 120 seconds.
+    retry_statuses: tuple of int
+        The response statuses which are retried.
+    rate_limit: float
+        The maximum number of requests per second sent to any one host, or None for no limit. Requests over the limit
+        wait their turn.
+    resumes: int
+        The number of times a response body whose connection drops partway through is resumed from where it left off,
+        using a Range request, before giving up on it. Bodies are only resumed if the server supports it.
+    """
+    def __init__(self, connect_timeout=10, read_timeout=60, retries=3, backoff_factor=0.5, backoff_jitter=0.5,
+                 backoff_max=60, retry_statuses=(429, 500, 502, 503, 504), rate_limit=None, resumes=3):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_jitter = backoff_jitter
+        self.backoff_max = backoff_max
+        self.retry_statuses = tuple(retry_statuses)
+        self.rate_limit = rate_limit
+        self.resumes = resumes
+
+    @property
+    def timeout(self):
+        """The (connect, read) timeout tuple to pass to requests."""
+        return self.connect_timeout, self.read_timeout
+
+    def retry(self):
+        """
+        The urllib3 Retry configuration implementing this policy, which reports each retry to the current observer as
+        a "retry" event.
+        """
+        Retry = _observed_retry()
+        kwargs = dict(total=self.retries, backoff_factor=self.backoff_factor, status_forcelist=self.retry_statuses,
+                      allowed_methods=Retry.DEFAULT_ALLOWED_METHODS, raise_on_status=False)
+        if _retry_supports_jitter():
+            kwargs.update(backoff_jitter=self.backoff_jitter, backoff_max=self.backoff_max)
+        return Retry(**kwargs)
+
+    def __repr__(self):
+        return "TransportPolicy({0})".format(", ".join("{0}={1!r}".format(key, value)
+                                                       for key, value in vars(self).items()))
+
+
+def _retry_supports_jitter():
+    """Whether or not the installed urllib3 supports jittered backoffs with a configurable maximum (urllib3 2 does)."""
+    from urllib3.util import Retry
+    return 'backoff_jitter' in inspect.signature(Retry.__init__).parameters
+
+
+@functools.lru_cache(maxsize=None)
+def _observed_retry():
+    from urllib3.util import Retry
+
+    class ObservedRetry(Retry):
+        """A urllib3 Retry which reports each retry it allows to the observer installed in the current context."""
+        def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+            retry = super().increment(method=method, url=url, response=response, error=error, _pool=_pool,
+                                      _stacktrace=_stacktrace)
+            observer = current_observer()
+            if observer.enabled:
+                uri = url
+                if _pool is not None:
+                    uri = "{0}://{1}:{2}{3}".format(_pool.scheme, _pool.host, _pool.port, url or "")
+                observer.event('retry', uri, status=response.status if response is not None else None,
+                               error=type(error).__name__ if error is not None else None)
+            return retry
+
+    ObservedRetry.__module__ = __name__
+    return ObservedRetry
+
+
+class _RateLimiter:
+    """Spaces out the requests sent to each host so that no more than `rate` go out per second."""
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# The rate limiter of each policy. Every adapter mounted with a policy shares its limiter, so that the limit holds
+# across schemes (http:// and https:// requests to a host are one stream of requests to it) and across remounts.
+_limiters = weakref.WeakKeyDictionary()
+_limiters_lock = threading.Lock()
+
+
+def _limiter(policy):
+    """The `_RateLimiter` shared by everything sending requests under the given policy, or None if it has no limit."""
+    if not policy.rate_limit:
+        return None
+    with _limiters_lock:
+        limiter = _limiters.get(policy)
+        if limiter is None or limiter.interval != 1 / policy.rate_limit:
+            limiter = _limiters[policy] = _RateLimiter(policy.rate_limit)
+        return limiter
+
+
+def _policy_adapter():
+    from requests.adapters import HTTPAdapter
+
+    class PolicyAdapter(HTTPAdapter):
+        """
+        An HTTP adapter which applies a `TransportPolicy` to every request sent through it: its retries, its timeouts
+        (unless the request sets its own), and its rate limit.
+        """
+        def __init__(self, policy, **kwargs):
+            self.policy = policy
+            self._limiter = _limiter(policy)
+            super().__init__(max_retries=policy.retry(), **kwargs)
+
+        def send(self, request, timeout=None, **kwargs):
+            if self._limiter is not None:
+                self._limiter.wait(urlsplit(request.url).netloc)
+            return super().send(request, timeout=self.policy.timeout if timeout is None else timeout, **kwargs)
+
+    PolicyAdapter.__module__ = __name__
+    return PolicyAdapter
+
+
+def __getattr__(name):
+    # `PolicyAdapter` subclasses the requests HTTPAdapter, so it is only defined, and requests only imported, when it
+    # is first asked for.
+    if name == 'PolicyAdapter':
+        global PolicyAdapter
+        PolicyAdapter = _policy_adapter()
+        return PolicyAdapter
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
@@ -3,6 +3,7 @@ setup(
     name = 'datafy',
     packages = ['datafy'], # this must be the same as the name above
     install_requires=['requests', 'requests-file', 'python-magic'],
+    extras_require={'async': ['aiohttp']},
     py_modules=['datafy'],
     version = '0.1.0',
     description = 'Read download URLs into datasets.',
@@ -1,10 +1,26 @@
 import unittest
+import requests
 import requests_mock
 import pytest
 import re
+import io
+import zipfile
+import tarfile
+import gzip
+import tempfile
+import threading
+import time
+import asyncio
+import functools
+import os
+import subprocess
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from urllib.parse import quote
+from unittest.mock import patch as mock_patch
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 import sys; sys.path.insert(0, '../')
-from datafy import datafy
+from datafy import datafy, aio, cache, resolver, observers, transport, archives
 
 
 # Helpers.
@@ -14,6 +30,102 @@ def read_file(fp):
         return f.read()
 
 
+class LocalServer:
+    """
+    A stand-in HTTP server serving the /data folder on localhost, for tests which need real network I/O. If `ranges` is
+    set the server supports Range requests, and drops the connection halfway through the first `drops` of them and the
+    first `full_drops` of the responses carrying a whole body. It answers the first `failures` GET requests with a
+    503, and waits `delay` seconds before answering each request. Paths under /redirect/ redirect to the rest of the
+    path.
+    """
+    class Handler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    class RangeHandler(Handler):
+        def do_HEAD(self):
+            self.respond(body=False)
+
+        def do_GET(self):
+            self.respond(body=True)
+
+        def respond(self, body):
+            time.sleep(self.server.delay)
+            if self.path.startswith('/redirect/'):
+                self.send_response(302)
+                self.send_header('Location', self.path[len('/redirect'):])
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if body:
+                with self.server.lock:
+                    fail = self.server.failures > 0
+                    self.server.failures -= fail
+                if fail:
+                    self.send_error(503)
+                    return
+
+            path = self.translate_path(self.path)
+            if not os.path.isfile(path):
+                self.send_error(404)
+                return
+            with open(path, 'rb') as f:
+                content = f.read()
+
+            requested = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+            if requested and body:
+                self.server.ranges_requested.append(self.headers['Range'])
+                start = int(requested.group(1))
+                end = int(requested.group(2)) if requested.group(2) else len(content) - 1
+                part = content[start:end + 1]
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(start, end, len(content)))
+            else:
+                part = content
+                self.send_response(200)
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Type', self.guess_type(path))
+            self.send_header('Content-Length', str(len(part)))
+            self.end_headers()
+
+            if body:
+                with self.server.lock:
+                    if requested:
+                        drop = self.server.drops > 0
+                        self.server.drops -= drop
+                    else:
+                        drop = self.server.full_drops > 0
+                        self.server.full_drops -= drop
+                self.wfile.write(part[:len(part) // 2] if drop else part)
+
+    def __init__(self, ranges=False, drops=0, full_drops=0, failures=0, delay=0):
+        self.ranges = ranges
+        self.drops = drops
+        self.full_drops = full_drops
+        self.failures = failures
+        self.delay = delay
+
+    def __enter__(self):
+        handler = functools.partial(self.RangeHandler if self.ranges else self.Handler,
+                                    directory=os.path.abspath('data'))
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.server.lock = threading.Lock()
+        self.server.drops = self.drops
+        self.server.full_drops = self.full_drops
+        self.server.failures = self.failures
+        self.server.delay = self.delay
+        self.server.ranges_requested = []
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def uri(self, fp):
+        return 'http://127.0.0.1:{0}/{1}'.format(self.server.server_port, quote(fp))
+
+
 def ok(results):
     """Return whether or not all results are status 200 OK."""
     return all([result['data'].ok for result in results])
@@ -236,3 +348,1109 @@ class TestFilesize(unittest.TestCase):
 
             results = datafy.get(uri, sizeout=123457, type_hints=type_hints)
             assert results
+
+    def test_sizeout_enforced_while_downloading(self):
+        # Data is cut off mid-transfer if the body goes over sizeout, even if the HEAD request doesn't say so.
+        uri = 'mock://data.cityofnewyork.us/api/views/kku6-nxdu/rows.csv?accessType=DOWNLOAD'
+        type_hints = ('text/csv', 'csv')
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, content=read_file('Demographic Statistics By Zip Code.csv'))
+            mock.head(uri, headers={})
+
+            with self.assertRaises(datafy.FileTooLargeException):
+                datafy.get(uri, sizeout=1000, type_hints=type_hints)
+            with self.assertRaises(datafy.FileTooLargeException):
+                datafy.get(uri, sizeout=1000, type_hints=type_hints, stream=True)
+
+    def test_sizeout_enforced_on_local_files(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as f:
+            f.write(read_file('Demographic Statistics By Zip Code.csv'))
+            f.flush()
+            uri = 'file://' + f.name
+
+            assert datafy.get(uri, sizeout=123457, type_hints=('text/csv', 'csv'))
+            with self.assertRaises(datafy.FileTooLargeException):
+                datafy.get(uri, sizeout=1000, type_hints=('text/csv', 'csv'))
+
+    def test_sizeout_enforced_on_uncompressed_archive_contents(self):
+        # A small archive which expands into a large file is rejected before anything is extracted.
+        uri = 'mock://example.com/bomb.zip'
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+            z.writestr('zeros.bin', b'\x00' * 10 ** 6)
+        content = buf.getvalue()
+        assert len(content) < 10 ** 4
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, content=content)
+            mock.head(uri, headers={'content-length': str(len(content))})
+
+            with self.assertRaises(datafy.FileTooLargeException):
+                datafy.get(uri, sizeout=10 ** 5, type_hints=('application/zip', 'zip'))
+            with self.assertRaises(datafy.FileTooLargeException):
+                datafy.get(uri, sizeout=10 ** 5, type_hints=('application/zip', 'zip'), stream=True)
+
+
+class TestStreaming(unittest.TestCase):
+    def test_streaming_core_file(self):
+        uri = 'mock://data.cityofnewyork.us/api/views/kku6-nxdu/rows.csv?accessType=DOWNLOAD'
+        content = read_file('Demographic Statistics By Zip Code.csv')
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, content=content, headers={'content-type': 'text/csv; charset=utf-8'})
+            results = datafy.get(uri, stream=True)
+
+        assert len(results) == 1
+        assert results[0]['data'].read() == content
+        results[0]['data'].close()
+        assert (results[0]['mimetype'], results[0]['extension']) == ('text/csv', 'csv')
+
+    def test_streaming_sniffs_type_from_spool(self):
+        uri = 'mock://data.cityofnewyork.us/download/vnwz-ihnf/application%2Fzip'
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, content=read_file('SustainabilityIndicators2012.xlsx'),
+                     headers={'content-type': 'application/octet-stream'})
+            results = datafy.get(uri, stream=True)
+
+        assert results[0]['mimetype'] == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        assert results[0]['extension'] == 'xlsx'
+
+    def test_streaming_archive_matches_in_memory_archive(self):
+        uri = 'mock://data.cityofnewyork.us/api/geospatial/arq3-7z49?method=export&format=Shapefile'
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, content=read_file('Subway Stations.zip'))
+            in_memory = datafy.get(uri, type_hints=('application/zip', 'zip'))
+            streamed = datafy.get(uri, type_hints=('application/zip', 'zip'), stream=True)
+
+        assert [r['filepath'] for r in streamed] == [r['filepath'] for r in in_memory]
+        assert [r['mimetype'] for r in streamed] == [r['mimetype'] for r in in_memory]
+        with zipfile.ZipFile('data/Subway Stations.zip') as z:
+            assert all(r['data'].read() == z.read(r['filepath']) for r in streamed)
+
+
+class TestErrorResponses(unittest.TestCase):
+    def test_error_pages_are_not_spooled(self):
+        uri = 'mock://example.com/missing.csv'
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, status_code=404, text='<html>Not Found</html>', headers={'content-type': 'text/html'})
+            # Without `stream` the response itself is returned, which can be checked.
+            assert not datafy.get(uri)[0]['data'].ok
+            with self.assertRaises(requests.HTTPError):
+                datafy.get(uri, stream=True)
+            with self.assertRaises(requests.HTTPError):
+                datafy.get(uri, type_hints=('text/csv', 'csv'), lazy=True)[0]['data'].read()
+
+    def test_aget_error_pages_are_not_spooled(self):
+        import aiohttp
+        with LocalServer() as server:
+            with self.assertRaises(aiohttp.ClientResponseError):
+                asyncio.run(aio.aget(server.uri('missing.csv')))
+
+
+class TestGetMany(unittest.TestCase):
+    def test_results_in_input_order(self):
+        csv_uri = 'mock://data.cityofnewyork.us/api/views/kku6-nxdu/rows.csv?accessType=DOWNLOAD'
+        json_uri = 'mock://data.cityofnewyork.us/api/views/kku6-nxdu/rows.json?accessType=DOWNLOAD'
+        geojson_uri = 'mock://data.cityofnewyork.us/api/geospatial/arq3-7z49?method=export&format=GeoJSON'
+
+        with requests_mock.Mocker() as mock:
+            mock.get(csv_uri, content=read_file('Demographic Statistics By Zip Code.csv'),
+                     headers={'content-type': 'text/csv'})
+            mock.get(json_uri, content=read_file('Demographic Statistics By Zip Code.json'),
+                     headers={'content-type': 'application/json'})
+            mock.get(geojson_uri, content=read_file('Subway Stations.geojson'),
+                     headers={'content-type': 'application/geo+json'})
+            for uri in (csv_uri, json_uri, geojson_uri):
+                mock.head(uri, headers={})
+
+            # The JSON file is the only one which is larger than the sizeout.
+            results = datafy.get_many([csv_uri, json_uri, geojson_uri, csv_uri], max_workers=4, sizeout=130000)
+
+        assert len(results) == 4
+        assert results[0][0]['extension'] == 'csv'
+        assert isinstance(results[1], datafy.FileTooLargeException)
+        assert results[2][0]['extension'] == 'geojson'
+        assert results[3][0]['extension'] == 'csv'
+
+    def test_per_host_limit(self):
+        lock = threading.Lock()
+        active, peak = {}, {}
+
+        def fake_get(uri, **kwargs):
+            host = uri.split('/')[2]
+            with lock:
+                active[host] = active.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), active[host])
+            time.sleep(0.01)
+            with lock:
+                active[host] -= 1
+            return [uri]
+
+        uris = ['mock://a.example.com/{0}'.format(i) for i in range(20)] + \
+               ['mock://b.example.com/{0}'.format(i) for i in range(20)]
+        with mock_patch.object(datafy, 'get', side_effect=fake_get):
+            results = datafy.get_many(uris, max_workers=8, max_per_host=2)
+
+        assert results == [[uri] for uri in uris]
+        assert peak == {'a.example.com': 2, 'b.example.com': 2}
+
+    def test_busy_host_does_not_block_others(self):
+        started = {}
+
+        def fake_get(uri, **kwargs):
+            started[uri] = time.perf_counter()
+            time.sleep(0.2 if 'slow' in uri else 0.01)
+            return [uri]
+
+        # A catalog grouped by host, with the slow host first: its URIs mustn't hold up the fast host's.
+        uris = ['mock://slow.example.com/{0}'.format(i) for i in range(8)] + \
+               ['mock://fast.example.com/{0}'.format(i) for i in range(4)]
+        start = time.perf_counter()
+        with mock_patch.object(datafy, 'get', side_effect=fake_get):
+            results = datafy.get_many(uris, max_workers=4, max_per_host=2)
+
+        assert results == [[uri] for uri in uris]
+        assert all(started[uri] - start < 0.15 for uri in uris if 'fast' in uri)
+
+    def test_sizeout_behind_redirect(self):
+        recorder = Recorder()
+        with LocalServer(ranges=True) as server:
+            with self.assertRaises(datafy.FileTooLargeException):
+                datafy.get(server.uri('redirect/Subway Stations.geojson'), sizeout=1000, observer=recorder)
+
+        # The HEAD request followed the redirect, so the GET was never sent.
+        assert [name for name, _, _ in recorder.phases] == ['head', 'get']
+
+
+class TestAsync(unittest.TestCase):
+    def test_aget_core_file(self):
+        with LocalServer() as server:
+            results = asyncio.run(aio.aget(server.uri('Demographic Statistics By Zip Code.csv')))
+
+        assert len(results) == 1
+        assert results[0]['data'].read() == read_file('Demographic Statistics By Zip Code.csv')
+        results[0]['data'].close()
+        assert (results[0]['filepath'], results[0]['mimetype'], results[0]['extension']) == ('.', 'text/csv', 'csv')
+
+    def test_aget_sniffs_unknown_content_type(self):
+        with LocalServer() as server:
+            results = asyncio.run(aio.aget(server.uri('SustainabilityIndicators2012.xlsx')))
+
+        assert results[0]['mimetype'] == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        assert results[0]['extension'] == 'xlsx'
+
+    def test_aget_archive(self):
+        with LocalServer() as server:
+            results = asyncio.run(aio.aget(server.uri('Subway Stations.zip')))
+
+        assert [(r['filepath'], r['extension']) for r in results] == [
+            ('geo_export_d62bc260-d954-43ac-a828-79cc9fd826fe.dbf', 'dbf'),
+            ('geo_export_d62bc260-d954-43ac-a828-79cc9fd826fe.shp', 'shp'),
+            ('geo_export_d62bc260-d954-43ac-a828-79cc9fd826fe.shx', 'shx'),
+            ('geo_export_d62bc260-d954-43ac-a828-79cc9fd826fe.prj', 'prj')
+        ]
+
+    def test_aget_sizeout(self):
+        with LocalServer() as server:
+            with self.assertRaises(datafy.FileTooLargeException):
+                asyncio.run(aio.aget(server.uri('Subway Stations.geojson'), sizeout=1000))
+
+    def test_aget_sizeout_behind_redirect(self):
+        recorder = Recorder()
+        with LocalServer(ranges=True) as server:
+            with self.assertRaises(datafy.FileTooLargeException):
+                asyncio.run(aio.aget(server.uri('redirect/Subway Stations.geojson'), sizeout=1000, observer=recorder))
+
+        # The HEAD request followed the redirect, so the GET was never sent.
+        assert [name for name, _, _ in recorder.phases] == ['head']
+
+    def test_aget_many_busy_host_does_not_block_others(self):
+        started = {}
+
+        async def fake_aget(uri, **kwargs):
+            started[uri] = time.perf_counter()
+            await asyncio.sleep(0.2 if 'slow' in uri else 0.01)
+            return [uri]
+
+        uris = ['mock://slow.example.com/{0}'.format(i) for i in range(8)] + \
+               ['mock://fast.example.com/{0}'.format(i) for i in range(4)]
+        start = time.perf_counter()
+        with mock_patch.object(aio, 'aget', side_effect=fake_aget):
+            results = asyncio.run(aio.aget_many(uris, max_workers=4, max_per_host=2))
+
+        assert results == [[uri] for uri in uris]
+        assert all(started[uri] - start < 0.15 for uri in uris if 'fast' in uri)
+
+    def test_aget_many(self):
+        with LocalServer() as server:
+            uris = [server.uri('Demographic Statistics By Zip Code.csv'), server.uri('Subway Stations.geojson'),
+                    server.uri('Demographic Statistics By Zip Code.json')]
+            results = asyncio.run(aio.aget_many(uris, max_workers=2, sizeout=130000))
+
+        assert results[0][0]['extension'] == 'csv'
+        assert results[1][0]['filepath'] == '.'
+        assert isinstance(results[2], datafy.FileTooLargeException)
+        for result in (results[0], results[1]):
+            result[0]['data'].close()
+
+
+class TestInArchive(unittest.TestCase):
+    @pytest.fixture(autouse=True)
+    def _no_extraction(self, monkeypatch):
+        # In-archive reads should never write the archive contents out to disk.
+        monkeypatch.setattr(zipfile.ZipFile, 'extractall', None)
+
+    def test_listing_matches_extraction(self):
+        for filename in ('Subway Stations.zip', 'NYC_Tech_Ecosystem_Data1.zip'):
+            uri = 'mock://example.com/' + quote(filename)
+            with zipfile.ZipFile('data/' + filename) as z:
+                expected_paths = [info.filename for info in z.infolist() if not info.is_dir()]
+
+            with requests_mock.Mocker() as mock:
+                mock.get(uri, content=read_file(filename))
+                results = datafy.get(uri, type_hints=('application/zip', 'zip'), in_archive=True)
+
+            assert [r['filepath'] for r in results] == expected_paths
+            assert [r['extension'] for r in results] == [p.split('.')[-1] for p in expected_paths]
+            assert all(isinstance(r['data'], datafy.ArchiveMember) for r in results)
+
+        assert [(r['filepath'], r['mimetype']) for r in results][-1] == (
+            'NYC_Tech_Ecosystem_Data/XLS_File/NYC_Tech_Ecosystem_Data.xlsx',
+            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+
+    def test_members_read_lazily(self):
+        uri = 'mock://example.com/LocalLaw4420150519.zip'
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, content=read_file('LocalLaw4420150519.zip'))
+            results = datafy.get(uri, type_hints=('application/zip', 'zip'), in_archive=True, stream=True)
+
+        with zipfile.ZipFile('data/LocalLaw4420150519.zip') as z:
+            for result in results:
+                with result['data'] as member:
+                    content = z.read(result['filepath'])
+                    # Reads carry on from where the last one left off, while `open` starts over.
+                    assert member.read(10) + member.read() == content
+                    assert member.read() == b''
+                    with member.open() as f:
+                        assert f.read() == content
+                    assert member.size == z.getinfo(result['filepath']).file_size
+
+        with self.assertRaises(ValueError):
+            results[0]['data'].read()
+
+
+class TestSniffing(unittest.TestCase):
+    def test_sniff_uses_range_request(self):
+        uri = 'mock://data.cityofnewyork.us/download/vnwz-ihnf/application%2Fzip'
+        content = read_file('SustainabilityIndicators2012.xlsx')
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, status_code=206, content=content[:4096], headers={'content-type': 'application/octet-stream'})
+            mime, ext = datafy.sniff(uri, sniff_size=4096)
+            assert mock.last_request.headers['Range'] == 'bytes=0-4095'
+
+        assert (mime, ext) == ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx')
+
+    def test_sniff_trusts_content_type(self):
+        uri = 'mock://data.cityofnewyork.us/api/views/kku6-nxdu/rows.csv?accessType=DOWNLOAD'
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, content=read_file('Demographic Statistics By Zip Code.csv'),
+                     headers={'content-type': 'text/csv; charset=utf-8'})
+            assert datafy.sniff(uri) == ('text/csv', 'csv')
+
+    def test_sniff_without_range_support(self):
+        # The stand-in server ignores Range headers, so the body has to be cut off after the first few bytes.
+        with LocalServer() as server:
+            mime, ext = datafy.sniff(server.uri('SustainabilityIndicators2012.xlsx'), sniff_size=4096)
+
+        assert (mime, ext) == ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx')
+
+    def test_get_sniff_size(self):
+        uri = 'mock://data.cityofnewyork.us/api/views/kku6-nxdu/rows.json?accessType=DOWNLOAD'
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, content=read_file('Demographic Statistics By Zip Code.json'))
+            # libmagic only recognizes JSON documents that it sees in their entirety, so JSON is recognized by a rule
+            # of the resolver instead, from the first few bytes.
+            with mock_patch.object(datafy.default_resolver, '_oracle', side_effect=AssertionError):
+                assert datafy.get(uri)[0]['mimetype'] == 'application/json'
+                assert datafy.get(uri, sniff_size=64, stream=True)[0]['mimetype'] == 'application/json'
+
+    def test_json_rule(self):
+        assert datafy._json_rule(b'\xef\xbb\xbf  {\n  "type": "FeatureCollection"') == ('application/json', 'json')
+        assert datafy._json_rule(b'[{"a": 1}, {"a": 2') == ('application/json', 'json')
+        assert datafy._json_rule(b'[1] Introduction') is None
+        assert datafy._json_rule(b'{ not json') is None
+        assert datafy._json_rule(b'a,b,c\n1,2,3') is None
+
+    def test_archive_members_with_known_extensions_are_not_read(self):
+        content = make_zip({'data.csv': b'a,b\n1,2\n', 'data.shp': b'\x00' * 100})
+        uri = 'mock://example.com/data.zip'
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, content=content)
+            with mock_patch.object(datafy, '_rewind', wraps=datafy._rewind) as rewind:
+                results = datafy.get(uri, in_archive=True, stream=True)
+
+        # The extension table settles what the sidecar is, so nothing was read off of it.
+        assert [call.args[1] for call in rewind.call_args_list] == [b'a,b\n1,2\n', None]
+        assert results[1]['mimetype'] == 'application/octet-stream'
+        for r in results:
+            r['data'].close()
+
+
+class TestLazy(unittest.TestCase):
+    def test_lazy_core_file(self):
+        uri = 'mock://data.cityofnewyork.us/api/views/kku6-nxdu/rows.csv?accessType=DOWNLOAD'
+        content = read_file('Demographic Statistics By Zip Code.csv')
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, content=content)
+            results = datafy.get(uri, type_hints=('text/csv', 'csv'), lazy=True)
+
+            # Nothing has been downloaded yet.
+            assert mock.call_count == 0
+            assert results == [{'data': results[0]['data'], 'filepath': '.', 'mimetype': 'text/csv', 'extension': 'csv'}]
+            assert not hasattr(results[0], '__dict__')
+
+            with results[0]['data'] as data:
+                # Reads carry on from where the last one left off, over the one GET request.
+                assert data.read(10) == content[:10]
+                assert data.read() == content[10:]
+                assert mock.call_count == 1
+
+                # Reading the resource again takes a new request.
+                with data.open() as f:
+                    assert f.read() == content
+                assert mock.call_count == 2
+
+        with self.assertRaises(ValueError):
+            results[0]['data'].read()
+
+    def test_lazy_sniffing(self):
+        uri = 'mock://data.cityofnewyork.us/download/vnwz-ihnf/application%2Fzip'
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, content=read_file('SustainabilityIndicators2012.xlsx'))
+            results = datafy.get(uri, lazy=True, sniff_size=4096)
+            assert mock.call_count == 1
+            assert mock.last_request.headers['Range'] == 'bytes=0-4095'
+
+        assert results[0]['extension'] == 'xlsx'
+
+    def test_lazy_sizeout(self):
+        uri = 'mock://data.cityofnewyork.us/api/views/kku6-nxdu/rows.csv?accessType=DOWNLOAD'
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, content=read_file('Demographic Statistics By Zip Code.csv'))
+            mock.head(uri, headers={})
+            results = datafy.get(uri, sizeout=1000, type_hints=('text/csv', 'csv'), lazy=True)
+
+            with self.assertRaises(datafy.FileTooLargeException):
+                results[0]['data'].read()
+
+    def test_lazy_archive(self):
+        uri = 'mock://data.cityofnewyork.us/api/geospatial/arq3-7z49?method=export&format=Shapefile'
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, content=read_file('Subway Stations.zip'), headers={'content-type': 'application/zip'})
+            results = datafy.get(uri, lazy=True)
+
+        assert all(isinstance(r, datafy.Record) for r in results)
+        assert all(isinstance(r['data'], datafy.ArchiveMember) for r in results)
+        assert [dict(r, data=None) for r in results][0] == {
+            'data': None,
+            'filepath': 'geo_export_d62bc260-d954-43ac-a828-79cc9fd826fe.dbf',
+            'mimetype': 'application/x-dbf',
+            'extension': 'dbf'
+        }
+        for r in results:
+            r['data'].close()
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = cache.Cache(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_revalidation(self):
+        uri = 'mock://data.cityofnewyork.us/api/views/kku6-nxdu/rows.csv?accessType=DOWNLOAD'
+        content = read_file('Demographic Statistics By Zip Code.csv')
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, [{'content': content, 'headers': {'etag': '"v1"', 'content-type': 'text/csv'}},
+                           {'status_code': 304}])
+            first = datafy.get(uri, cache=self.cache)
+            second = datafy.get(uri, cache=self.cache)
+            assert 'If-None-Match' not in mock.request_history[0].headers
+            assert mock.request_history[1].headers['If-None-Match'] == '"v1"'
+
+        for results in (first, second):
+            assert [(r['filepath'], r['mimetype'], r['extension']) for r in results] == [('.', 'text/csv', 'csv')]
+            with results[0]['data'] as data:
+                assert data.read() == content
+
+    def test_revalidation_of_archives(self):
+        uri = 'mock://data.cityofnewyork.us/api/geospatial/arq3-7z49?method=export&format=Shapefile'
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, [{'content': read_file('Subway Stations.zip'),
+                            'headers': {'last-modified': 'Mon, 23 Jan 2017 00:00:00 GMT'}},
+                           {'status_code': 304}])
+            first = datafy.get(uri, type_hints=('application/zip', 'zip'), cache=self.cache)
+            with mock_patch.object(datafy.default_resolver, '_oracle', side_effect=AssertionError):
+                second = datafy.get(uri, cache=self.cache)
+            assert mock.request_history[1].headers['If-Modified-Since'] == 'Mon, 23 Jan 2017 00:00:00 GMT'
+
+        assert [dict(r, data=None) for r in first] == [dict(r, data=None) for r in second]
+        assert second[0]['data'].read() == first[0]['data'].read()
+        for r in first + second:
+            r['data'].close()
+
+    def test_changed_resource_is_replaced(self):
+        uri = 'mock://example.com/data.csv'
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, [{'content': b'a,b\n1,2\n', 'headers': {'etag': '"v1"', 'content-type': 'text/csv'}},
+                           {'content': b'a,b\n3,4\n', 'headers': {'etag': '"v2"', 'content-type': 'text/csv'}}])
+            datafy.get(uri, cache=self.cache)[0]['data'].close()
+            with datafy.get(uri, cache=self.cache)[0]['data'] as data:
+                assert data.read() == b'a,b\n3,4\n'
+
+        assert self.cache.lookup(uri)['etag'] == '"v2"'
+        assert len(os.listdir(os.path.join(self.directory.name, 'objects'))) == 1
+
+    def test_lru_eviction(self):
+        lru = cache.Cache(self.directory.name, max_bytes=20)
+
+        with requests_mock.Mocker() as mock:
+            for name in 'abc':
+                mock.get('mock://example.com/' + name, content=name.encode() * 10, headers={'content-type': 'text/csv'})
+            for name in 'abac':
+                datafy.get('mock://example.com/' + name, cache=lru)[0]['data'].close()
+
+        # b was the least recently used when c was added, so it was evicted.
+        assert lru.lookup('mock://example.com/b') is None
+        assert lru.lookup('mock://example.com/a') is not None
+        assert lru.lookup('mock://example.com/c') is not None
+        assert lru.size() == 20
+
+        # The index persists between sessions.
+        assert cache.Cache(self.directory.name).lookup('mock://example.com/c')['size'] == 10
+
+    def test_failed_reads_leave_nothing_behind(self):
+        uri = 'mock://example.com/data.csv'
+
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, content=b'a,b\n1,2\n', headers={'content-type': 'text/csv'})
+            with mock_patch.object(datafy, '_find_reader', side_effect=RuntimeError):
+                with self.assertRaises(RuntimeError):
+                    datafy.get(uri, cache=self.cache)
+
+        assert os.listdir(os.path.join(self.directory.name, 'objects')) == []
+        assert self.cache.size() == 0 and not self.cache._references
+
+    def test_ingested_bodies_are_held_until_released(self):
+        digest, size = self.cache.ingest([b'a,b\n1,2\n'])
+        self.cache.store('mock://example.com/data.csv', digest, size, {}, [('.', 'text/csv', 'csv')])
+
+        # Replacing the only entry that refers to the body doesn't delete it while it's still held.
+        other, _ = self.cache.ingest([b'a,b\n3,4\n'])
+        self.cache.store('mock://example.com/data.csv', other, size, {}, [('.', 'text/csv', 'csv')])
+        assert os.path.exists(self.cache.path({'digest': digest}))
+
+        self.cache.release(digest)
+        self.cache.release(other)
+        assert not os.path.exists(self.cache.path({'digest': digest}))
+        assert os.path.exists(self.cache.path({'digest': other}))
+        assert self.cache.size() == size
+
+    def test_lookups_only_append_to_the_journal(self):
+        digest, size = self.cache.ingest([b'a,b\n1,2\n'])
+        self.cache.store('mock://example.com/data.csv', digest, size, {}, [('.', 'text/csv', 'csv')])
+        self.cache.release(digest)
+        self.cache.flush()
+
+        with mock_patch.object(self.cache, '_save', side_effect=AssertionError):
+            accessed = [self.cache.lookup('mock://example.com/data.csv')['accessed'] for _ in range(10)]
+
+        # The access times are recovered from the journal when the cache is opened again.
+        reopened = cache.Cache(self.directory.name)
+        assert reopened._journal_length == 10
+        assert reopened.lookup('mock://example.com/data.csv')['accessed'] > accessed[-1]
+        assert reopened.size() == size
+
+    def test_journal_is_folded_into_the_index(self):
+        digest, size = self.cache.ingest([b'a,b\n1,2\n'])
+        for i in range(10):
+            self.cache.store('mock://example.com/{0}.csv'.format(i), digest, size, {}, [('.', 'text/csv', 'csv')])
+        self.cache.release(digest)
+        for i in range(1100):
+            self.cache.lookup('mock://example.com/{0}.csv'.format(i % 10))
+
+        # The journal is folded in once it outgrows the index, so it stays in proportion to it.
+        assert self.cache._journal_length < 1024
+        reopened = cache.Cache(self.directory.name)
+        assert len(reopened._index) == 10 and reopened.size() == size
+        assert reopened._index == self.cache._index
+
+
+class TestRangedDownload(unittest.TestCase):
+    def ranged_mock(self, mock, uri, old, new, content_range=None):
+        """
+        Mocks a resource which changed from `old` to `new` after its HEAD request was answered: Range requests made
+        with the old ETag in If-Range get the whole of the new version, as they would from a real server. If
+        `content_range` is given, Range requests get a 206 with that Content-Range instead.
+        """
+        def get(request, context):
+            if 'Range' not in request.headers:
+                return new
+            if content_range is not None:
+                context.status_code = 206
+                context.headers['Content-Range'] = content_range
+                return new[:10]
+            assert request.headers['If-Range'] == '"v1"'
+            return new
+
+        mock.head(uri, headers={'accept-ranges': 'bytes', 'content-length': str(len(old)), 'etag': '"v1"'})
+        mock.get(uri, content=get, headers={'etag': '"v2"'})
+
+    def test_changed_resource_is_downloaded_whole(self):
+        uri = 'mock://example.com/data.csv'
+        old, new = b'a,b\n' + b'1,2\n' * 100, b'a,b\n' + b'3,4\n' * 150
+
+        with requests_mock.Mocker() as mock:
+            self.ranged_mock(mock, uri, old, new)
+            results = datafy.get(uri, type_hints=('text/csv', 'csv'), connections=4)
+            ranged = [request for request in mock.request_history if 'Range' in request.headers]
+
+        assert ranged and all(request.headers['If-Range'] == '"v1"' for request in ranged)
+        assert results[0]['data'].read() == new
+
+    def test_mismatched_content_range_is_not_spooled(self):
+        uri = 'mock://example.com/data.csv'
+        old, new = b'a,b\n' + b'1,2\n' * 100, b'a,b\n' + b'3,4\n' * 150
+
+        # The server answers with a part of a resource of a different length than the HEAD request said.
+        with requests_mock.Mocker() as mock:
+            self.ranged_mock(mock, uri, old, new, content_range='bytes 0-9/{0}'.format(len(new)))
+            results = datafy.get(uri, type_hints=('text/csv', 'csv'), connections=4)
+
+        assert results[0]['data'].read() == new
+
+    def test_ranged_download(self):
+        content = read_file('SustainabilityIndicators2012.xlsx')
+
+        with LocalServer(ranges=True) as server:
+            results = datafy.get(server.uri('SustainabilityIndicators2012.xlsx'), connections=4)
+            assert len(server.server.ranges_requested) == 4
+
+        assert results[0]['extension'] == 'xlsx'
+        with results[0]['data'] as data:
+            assert data.read() == content
+
+    def test_ranged_download_resumes_dropped_ranges(self):
+        content = read_file('SustainabilityIndicators2012.xlsx')
+
+        with LocalServer(ranges=True, drops=1) as server:
+            results = datafy.get(server.uri('SustainabilityIndicators2012.xlsx'), connections=2)
+            requested = server.server.ranges_requested
+
+        # The dropped range is resumed from where it left off, rather than from its start.
+        assert len(requested) == 3
+        starts = [int(r[len('bytes='):].split('-')[0]) for r in requested]
+        assert len(set(starts)) == 3
+        with results[0]['data'] as data:
+            assert data.read() == content
+
+    def test_ranged_download_of_archive(self):
+        with LocalServer(ranges=True) as server:
+            results = datafy.get(server.uri('Subway Stations.zip'), connections=3, in_archive=True)
+
+        assert [r['extension'] for r in results] == ['dbf', 'shp', 'shx', 'prj']
+        for r in results:
+            r['data'].close()
+
+    def test_fallback_without_range_support(self):
+        # Without Range support the resource comes down a single stream, but is still handed back as a spooled file.
+        with LocalServer() as server:
+            results = datafy.get(server.uri('Demographic Statistics By Zip Code.csv'), connections=4)
+            assert not server.server.ranges_requested
+
+        assert results[0]['extension'] == 'csv'
+        with results[0]['data'] as data:
+            assert data.read() == read_file('Demographic Statistics By Zip Code.csv')
+
+
+class TestLocalFiles(unittest.TestCase):
+    def test_local_files_are_memory_mapped(self):
+        path = os.path.abspath('data/SustainabilityIndicators2012.xlsx')
+        content = read_file('SustainabilityIndicators2012.xlsx')
+
+        with mock_patch.object(datafy.requests_session, 'get', side_effect=AssertionError):
+            results = datafy.get('file://' + path)
+
+        assert results[0]['filepath'] == path
+        assert results[0]['extension'] == 'xlsx'
+        with results[0]['data'] as data:
+            assert isinstance(data, datafy.MappedFile)
+            assert data.ok
+            assert data.buffer[:4] == content[:4]
+            assert data.read(4) == content[:4]
+            assert data.read() == content[4:]
+            assert data.content == content
+
+    def test_local_files_are_sniffed_from_their_head(self):
+        path = os.path.abspath('data/Demographic Statistics By Zip Code.csv')
+
+        with mock_patch.object(datafy, '_pread_head', wraps=datafy._pread_head) as pread_head:
+            results = datafy.get('file://' + path, sniff_size=2048)
+            pread_head.assert_called_once_with(path, 2048)
+
+        assert (results[0]['mimetype'], results[0]['extension']) == ('text/csv', 'csv')
+
+    def test_empty_local_file(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as f:
+            results = datafy.get('file://' + f.name, type_hints=('text/csv', 'csv'))
+            assert results[0]['data'].read() == b''
+
+    def test_lazy_local_files_are_memory_mapped(self):
+        path = os.path.abspath('data/Demographic Statistics By Zip Code.csv')
+
+        with mock_patch.object(datafy, 'sniff', side_effect=AssertionError), \
+                mock_patch.object(datafy.requests_session, 'get', side_effect=AssertionError):
+            results = datafy.get('file://' + path, lazy=True)
+
+        assert isinstance(results[0], datafy.Record)
+        assert (results[0]['mimetype'], results[0]['extension']) == ('text/csv', 'csv')
+        with results[0]['data'] as data:
+            assert isinstance(data, datafy.MappedFile)
+            assert data.read() == read_file('Demographic Statistics By Zip Code.csv')
+
+    def test_lazy_local_archives_are_read_in_place(self):
+        path = os.path.abspath('data/Subway Stations.zip')
+        results = datafy.get('file://' + path, lazy=True)
+
+        assert [r['extension'] for r in results] == ['dbf', 'shp', 'shx', 'prj']
+        assert all(isinstance(r['data'], datafy.ArchiveMember) for r in results)
+        for r in results:
+            r['data'].close()
+
+    def test_local_archive(self):
+        path = os.path.abspath('data/Subway Stations.zip')
+        results = datafy.get('file://' + path, in_archive=True)
+
+        assert [r['extension'] for r in results] == ['dbf', 'shp', 'shx', 'prj']
+        for r in results:
+            r['data'].close()
+
+
+def make_zip(files):
+    """Build a ZIP archive holding the given {name: bytes} files, in memory."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as z:
+        for name, content in files.items():
+            z.writestr(name, content)
+    return buffer.getvalue()
+
+
+def make_tar(files, compression=''):
+    """Build a (possibly compressed) TAR archive holding the given {name: bytes} files, in memory."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:' + compression) as tf:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tf.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+class TestNestedArchives(unittest.TestCase):
+    @pytest.fixture(autouse=True)
+    def _no_extraction(self, monkeypatch, tmp_path):
+        self.csv = read_file('Demographic Statistics By Zip Code.csv')
+        self.geojson = read_file('Subway Stations.geojson')
+
+        # Nothing should be written out to disk under the working directory, nested archives included.
+        monkeypatch.setattr(zipfile.ZipFile, 'extractall', None)
+        monkeypatch.setattr(tarfile.TarFile, 'extractall', None)
+        monkeypatch.chdir(tmp_path)
+        yield
+        assert os.listdir(tmp_path) == []
+
+    def get(self, filename, content, **kwargs):
+        uri = 'mock://example.com/' + filename
+        with requests_mock.Mocker() as mock:
+            mock.head(uri, headers={})
+            mock.get(uri, content=content)
+            return datafy.get(uri, **kwargs)
+
+    @unittest.skipUnless(os.path.isdir('/proc/self/fd'), "Needs /proc to count open file descriptors.")
+    def test_members_share_one_descriptor(self):
+        files = {'part{0}.csv'.format(i): 'a,b\n{0},{0}\n'.format(i).encode() for i in range(500)}
+        before = len(os.listdir('/proc/self/fd'))
+        results = self.get('parts.zip', make_zip(files), type_hints=('application/zip', 'zip'))
+
+        # However many members there are, they are all views of the one mapping.
+        assert len(os.listdir('/proc/self/fd')) - before < 10
+        assert [r['data'].read() for r in results] == list(files.values())
+        assert results[-1]['data'].seek(0) == 0 and results[-1]['data'].content == files['part499.csv']
+        for r in results:
+            r['data'].close()
+        with self.assertRaises(ValueError):
+            results[0]['data'].read()
+
+    def test_zip_in_zip(self):
+        inner = make_zip({'stations.geojson': self.geojson})
+        content = make_zip({'inner.zip': inner, 'stats.csv': self.csv})
+
+        for in_archive in (False, True):
+            results = self.get('outer.zip', content, in_archive=in_archive)
+            assert [(r['filepath'], r['extension']) for r in results] == [
+                ('inner.zip/stations.geojson', 'geojson'), ('stats.csv', 'csv')
+            ]
+            assert results[0]['data'].read() == self.geojson
+            assert results[1]['data'].read() == self.csv
+            for r in results:
+                r['data'].close()
+
+    def test_tar_gz(self):
+        content = make_tar({'data/stats.csv': self.csv, 'data/nested.zip': make_zip({'a.csv': self.csv})}, 'gz')
+        results = self.get('bundle.tar.gz', content)
+
+        assert [r['filepath'] for r in results] == ['data/stats.csv', 'data/nested.zip/a.csv']
+        assert all(isinstance(r['data'], datafy.MappedFile) for r in results)
+        assert all(r['data'].content == self.csv for r in results)
+
+    def test_gzip_compressed_file(self):
+        results = self.get('stats.csv.gz', gzip.compress(self.csv), in_archive=True)
+
+        assert [(r['filepath'], r['mimetype']) for r in results] == [('.', 'text/csv')]
+        assert results[0]['data'].size is None
+        assert results[0]['data'].read() == self.csv
+
+    def test_depth_limit(self):
+        content = make_zip({'a.zip': make_zip({'b.zip': make_zip({'c.csv': self.csv})})})
+
+        assert [r['filepath'] for r in self.get('x.zip', content)] == ['a.zip/b.zip/c.csv']
+        results = self.get('x.zip', content, max_depth=1)
+        assert [(r['filepath'], r['extension']) for r in results] == [('a.zip/b.zip', 'zip')]
+
+    def test_sizeout_covers_nested_contents(self):
+        content = make_zip({'a.zip': make_zip({'b.csv': self.csv, 'c.csv': self.csv})})
+
+        with self.assertRaises(datafy.FileTooLargeException):
+            self.get('x.zip', content, sizeout=len(self.csv) + 1)
+        with self.assertRaises(datafy.FileTooLargeException):
+            self.get('x.csv.gz', gzip.compress(self.csv), sizeout=len(self.csv) // 2)
+
+    def test_sizeout_covers_members_read_in_place(self):
+        content = gzip.compress(bytes(10 ** 7))
+
+        for kwargs in ({'in_archive': True}, {'lazy': True}):
+            results = self.get('b.csv.gz', content, sizeout=10 ** 5, **kwargs)
+            with results[0]['data'] as member:
+                with self.assertRaises(datafy.FileTooLargeException):
+                    member.read()
+
+        # Reading a member again doesn't charge its bytes twice.
+        results = self.get('b.csv.gz', gzip.compress(self.csv), sizeout=len(self.csv), in_archive=True)
+        with results[0]['data'] as member:
+            assert member.read() == self.csv
+            with member.open() as f:
+                assert f.read() == self.csv
+
+    def stored_zip(self, size):
+        """A ZIP archive holding `size` zeroes, uncompressed, which makes for a small archive once compressed again."""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as z:
+            z.writestr('zeroes.bin', bytes(size))
+        return buffer.getvalue()
+
+    def test_sizeout_covers_archive_in_tar_in_zip(self):
+        content = make_zip({'bomb.tar.gz': make_tar({'inner.zip': self.stored_zip(5 * 10 ** 6)}, 'gz')})
+        assert len(content) < 50000
+
+        # The archive in the TAR file is charged at its declared size before it is read, so it is never buffered.
+        with mock_patch.object(archives, '_buffer', side_effect=AssertionError):
+            with self.assertRaises(datafy.FileTooLargeException):
+                self.get('outer.zip', content, sizeout=10 ** 6)
+
+    def test_sizeout_covers_buffered_archives(self):
+        content = make_zip({'inner.zip.gz': gzip.compress(self.stored_zip(5 * 10 ** 6))})
+        buffered = []
+
+        def buffer(f):
+            buffered.append(0)
+            while True:
+                chunk = f.read(2 ** 16)
+                if not chunk:
+                    raise AssertionError("The whole archive was buffered.")
+                buffered[0] += len(chunk)
+
+        # The size of a compressed file isn't known up front, so it is charged as it is buffered.
+        with mock_patch.object(archives, '_buffer', side_effect=buffer):
+            with self.assertRaises(datafy.FileTooLargeException):
+                self.get('outer.zip', content, sizeout=10 ** 6)
+        assert buffered[0] <= 10 ** 6
+
+
+class TestParallelClassification(unittest.TestCase):
+    def get(self, filename, **kwargs):
+        uri = 'mock://example.com/' + quote(filename)
+        with requests_mock.Mocker() as mock:
+            mock.get(uri, content=read_file(filename))
+            return datafy.get(uri, in_archive=True, **kwargs)
+
+    def test_pools_preserve_archive_order(self):
+        expected = [(r['filepath'], r['mimetype']) for r in self.get('NYC_Tech_Ecosystem_Data1.zip')]
+
+        for pool in (ThreadPoolExecutor(max_workers=4), ProcessPoolExecutor(max_workers=2)):
+            with pool, mock_patch.object(datafy, 'CLASSIFY_BACKLOG', 2):
+                results = self.get('NYC_Tech_Ecosystem_Data1.zip', executor=pool)
+            assert [(r['filepath'], r['mimetype']) for r in results] == expected
+
+    def test_sidecars_skip_magic(self):
+        with mock_patch.object(datafy, '_sniff_mime', side_effect=AssertionError):
+            results = self.get('Subway Stations.zip')
+
+        assert [(r['extension'], r['mimetype']) for r in results] == [
+            ('dbf', 'application/x-dbf'), ('shp', 'application/octet-stream'),
+            ('shx', 'application/octet-stream'), ('prj', 'text/plain')
+        ]
+
+
+class TestTypeResolver(unittest.TestCase):
+    def setUp(self):
+        self.resolver = resolver.TypeResolver({'text/csv': 'csv'}, {'prj': 'text/plain'})
+        self.csv = read_file('Demographic Statistics By Zip Code.csv')[:4096]
+
+    def test_rules_before_oracle(self):
+        with mock_patch.object(self.resolver, '_oracle', side_effect=AssertionError):
+            assert self.resolver.resolve('text/csv; charset=utf-8', b'') == ('text/csv', 'csv')
+            assert self.resolver.resolve(None, b'', 'mock://example.com/data/stations.PRJ') == ('text/plain', 'prj')
+
+            self.resolver.register_signature(b'ABCD', 'application/x-abcd', offset=2)
+            self.resolver.register_mime('application/x-abcd', 'abcd')
+            assert self.resolver.resolve(None, b'..ABCD..') == ('application/x-abcd', 'abcd')
+
+    def test_oracle_answers_memoized(self):
+        with mock_patch.object(self.resolver, '_oracle', wraps=self.resolver._oracle) as oracle:
+            first = self.resolver.resolve('application/octet-stream', self.csv, 'rows.csv')
+            assert self.resolver.resolve('application/octet-stream', lambda: self.csv, 'rows.csv') == first
+            assert oracle.call_count == 1
+
+            # A different header digest is a different key.
+            self.resolver.resolve('application/octet-stream', self.csv[:-1], 'rows.csv')
+            assert oracle.call_count == 2
+
+    def test_memo_is_bounded(self):
+        self.resolver.memo_size = 2
+        for i in range(4):
+            self.resolver.resolve(None, self.csv + bytes([i]))
+        assert len(self.resolver._memo) == 2
+
+    def test_resolve_many(self):
+        items = [(None, self.csv, 'a.csv'), ('text/csv', b'', None), (None, lambda: self.csv, 'b.CSV')]
+        with mock_patch.object(self.resolver, '_oracle', wraps=self.resolver._oracle) as oracle:
+            for executor in (None, ThreadPoolExecutor(max_workers=2)):
+                self.resolver.clear()
+                results = self.resolver.resolve_many(items, executor=executor)
+                assert results == [('text/csv', 'csv')] * 3
+            assert oracle.call_count == 2
+
+
+class Recorder(observers.Observer):
+    """An observer which keeps a list of what it is told."""
+    def __init__(self):
+        self.phases = []
+        self.events = []
+
+    def on_phase(self, name, uri, seconds, details):
+        self.phases.append((name, uri, details))
+
+    def on_event(self, name, uri, details):
+        self.events.append((name, uri, details))
+
+
+class TestObservers(unittest.TestCase):
+    def test_phases_of_archive(self):
+        uri = 'mock://example.com/' + quote('Subway Stations.zip')
+        recorder = Recorder()
+
+        with requests_mock.Mocker() as mock:
+            mock.head(uri, headers={'content-length': '100'})
+            mock.get(uri, content=read_file('Subway Stations.zip'), headers={'content-type': 'application/zip'})
+            datafy.get(uri, sizeout=10 ** 6, stream=True, observer=recorder)
+
+        assert [name for name, _, _ in recorder.phases] == ['head', 'transfer', 'detect', 'archive', 'get']
+        details = {name: details for name, _, details in recorder.phases}
+        assert details['transfer']['bytes'] == len(read_file('Subway Stations.zip'))
+        assert details['archive']['members'] == 4
+        assert details['get']['documents'] == 4
+
+    def test_context_manager_reaches_worker_threads(self):
+        stats = observers.Stats()
+        with LocalServer() as server, observers.observe(stats):
+            datafy.get_many([server.uri('Demographic Statistics By Zip Code.csv'), server.uri('Subway Stations.zip')],
+                            stream=True)
+        assert datafy.current_observer() is not stats
+
+        summary = stats.summary()
+        assert summary['phases']['get']['count'] == 2
+        assert summary['phases']['archive']['details']['members'] == 4
+        assert sum(summary['phases']['get']['histogram']) == 2
+
+        output = io.StringIO()
+        stats.print_summary(file=output)
+        assert output.getvalue().startswith('get')
+
+    def test_retries_and_cache_hits_reported(self):
+        recorder = Recorder()
+        with LocalServer(ranges=True, drops=1) as server:
+            datafy.get(server.uri('SustainabilityIndicators2012.xlsx'), connections=2, observer=recorder)
+        assert [name for name, _, _ in recorder.events] == ['retry']
+
+        uri = 'mock://example.com/rows.csv'
+        with tempfile.TemporaryDirectory() as directory, requests_mock.Mocker() as mock:
+            mock.get(uri, [{'content': b'a,b\n1,2\n', 'headers': {'etag': '"x"'}}, {'status_code': 304}])
+            for _ in range(2):
+                datafy.get(uri, cache=cache.Cache(directory), type_hints=('text/csv', 'csv'), observer=recorder)
+        assert [name for name, _, _ in recorder.events[1:]] == ['cache_miss', 'cache_hit']
+        assert [name for name, _, _ in recorder.phases[-5:]] == ['revalidate', 'transfer', 'get', 'revalidate', 'get']
+
+    def test_null_observer_by_default(self):
+        assert not datafy.current_observer().enabled
+        assert datafy.current_observer().phase('get', 'uri') is observers._null_span
+
+
+class TestTransportPolicy(unittest.TestCase):
+    def setUp(self):
+        self.policy = datafy.transport_policy
+
+    def tearDown(self):
+        datafy.configure(self.policy)
+
+    def test_dropped_body_resumed(self):
+        content = read_file('SustainabilityIndicators2012.xlsx')
+        recorder = Recorder()
+
+        with LocalServer(ranges=True, full_drops=1) as server:
+            results = datafy.get(server.uri('SustainabilityIndicators2012.xlsx'), stream=True, observer=recorder)
+            requested = server.server.ranges_requested
+
+        # Only the part of the body which hadn't arrived yet is requested again.
+        assert len(requested) == 1 and requested[0] != 'bytes=0-'
+        assert [name for name, _, _ in recorder.events] == ['resume']
+        with results[0]['data'] as data:
+            assert data.read() == content
+
+    def test_dropped_body_resumed_in_memory(self):
+        with LocalServer(ranges=True, full_drops=1) as server:
+            results = datafy.get(server.uri('SustainabilityIndicators2012.xlsx'))
+            assert len(server.server.ranges_requested) == 1
+
+        assert results[0]['extension'] == 'xlsx'
+        assert results[0]['data'].content == read_file('SustainabilityIndicators2012.xlsx')
+
+    def test_dropped_body_not_resumed_past_policy(self):
+        datafy.configure(transport.TransportPolicy(resumes=0))
+        with LocalServer(ranges=True, full_drops=1) as server:
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                datafy.get(server.uri('SustainabilityIndicators2012.xlsx'), stream=True)
+
+    def test_server_errors_retried(self):
+        datafy.configure(transport.TransportPolicy(backoff_factor=0, backoff_jitter=0))
+        recorder = Recorder()
+        with LocalServer(ranges=True, failures=2) as server:
+            results = datafy.get(server.uri('Demographic Statistics By Zip Code.csv'), stream=True, observer=recorder)
+        assert results[0]['data'].read() == read_file('Demographic Statistics By Zip Code.csv')
+
+        # Both retries were reported to the observer.
+        assert [(name, details['status']) for name, _, details in recorder.events] == [('retry', 503), ('retry', 503)]
+
+    def test_retry_without_jitter_support(self):
+        class Retry:
+            DEFAULT_ALLOWED_METHODS = frozenset(['GET'])
+
+            def __init__(self, **kwargs):
+                self.kwargs = kwargs
+
+        # urllib3 1.26, which requests still allows, has neither `backoff_jitter` nor `backoff_max`.
+        with mock_patch.object(transport, '_retry_supports_jitter', return_value=False), \
+                mock_patch.object(transport, '_observed_retry', return_value=Retry):
+            retry = transport.TransportPolicy(retries=5).retry()
+
+        assert retry.kwargs['total'] == 5
+        assert 'backoff_jitter' not in retry.kwargs and 'backoff_max' not in retry.kwargs
+
+    def test_read_timeout(self):
+        datafy.configure(transport.TransportPolicy(read_timeout=0.1, retries=0))
+        with LocalServer(ranges=True, delay=0.5) as server:
+            start = time.perf_counter()
+            with self.assertRaises((requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+                datafy.get(server.uri('Demographic Statistics By Zip Code.csv'))
+            assert time.perf_counter() - start < 0.5
+
+    def test_rate_limit(self):
+        limiter = transport._RateLimiter(rate=20)
+        start = time.perf_counter()
+        for _ in range(3):
+            limiter.wait('example.com')
+        limiter.wait('example.org')
+        assert 0.1 <= time.perf_counter() - start < 0.2
+
+
+    def test_rate_limit_shared_across_adapters(self):
+        datafy.configure(transport.TransportPolicy(rate_limit=5))
+        session = datafy.requests_session
+        limiter = session.get_adapter('http://example.com')._limiter
+        assert limiter is not None and session.get_adapter('https://example.com')._limiter is limiter
+
+        # Growing the connection pool remounts the adapters, which mustn't start the limit over.
+        datafy._resize_pool(64, 16)
+        assert session.get_adapter('http://example.com')._limiter is limiter
+        assert 'limiter' not in repr(datafy.transport_policy)
+
+class TestLazyImport(unittest.TestCase):
+    def run_python(self, code):
+        # A fresh interpreter, so that nothing the other tests imported is already loaded.
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True,
+                              check=True).stdout.split()
+
+    def test_import_defers_dependencies(self):
+        loaded = self.run_python(
+            "import sys, datafy\n"
+            "print(*[m for m in ('requests', 'requests_file', 'magic', 'asyncio') if m in sys.modules])\n"
+            "print(datafy.datafy._requests_session)"
+        )
+        assert loaded == ['None']
+
+    def test_local_paths_with_type_hints_skip_requests(self):
+        loaded = self.run_python(
+            "import sys, datafy\n"
+            "datafy.get('file://' + __import__('os').path.abspath('tests/data/Demographic Statistics By Zip Code.csv'),\n"
+            "           type_hints=('text/csv', 'csv'))\n"
+            "print(*[m for m in ('requests', 'magic') if m in sys.modules])"
+        )
+        assert loaded == []
+
+    def test_session_built_on_first_use(self):
+        loaded = self.run_python(
+            "import sys, datafy\n"
+            "from datafy import datafy as module\n"
+            "session = module.requests_session\n"
+            "print(session is module._session(), session.adapters['https://'].__class__.__name__)"
+        )
+        assert loaded == ['True', 'PolicyAdapter']